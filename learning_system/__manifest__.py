@@ -1,6 +1,6 @@
 {
     'name': 'Learning System',
-    'version': '16.0.1.0.1',
+    'version': '16.0.1.0.2',
     'category': 'Education',
     'summary': 'Adaptive Learning System based on Rescorla-Wagner Theory',
     'description': """
@@ -13,7 +13,7 @@
     """,
     'author': 'Your Company',
     'website': 'https://www.yourcompany.com',
-    'depends': ['base', 'web','mail'],
+    'depends': ['base', 'web', 'bus', 'mail'],
     'external_dependencies': {
         'python': ['requests'],
     },
@@ -29,9 +29,20 @@
         'views/ai_call_statistics_views.xml',
         'views/collection_views.xml',
         'views/menu_views.xml',
+        'views/audio_job_views.xml',
+        'views/ai_job_views.xml',
+        'views/ai_price_views.xml',
+        'views/import_job_views.xml',
         'data/demo_data.xml',
         'data/ai_config_data.xml',
+        'data/ai_price_data.xml',
+        'data/ir_cron_data.xml',
     ],
+    'assets': {
+        'web.assets_backend': [
+            'learning_system/static/src/js/ai_job_progress_service.js',
+        ],
+    },
     'demo': [
         'data/demo_data.xml',
     ],
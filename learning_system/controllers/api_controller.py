@@ -1,26 +1,206 @@
-from odoo import http
+import odoo
+from odoo import api, http, SUPERUSER_ID
 from odoo.http import request
+from odoo.exceptions import UserError
+from collections import namedtuple
 import json
+import logging
+
+from . import wire_format
+from .response_cache import response_cache, make_etag
+
+
+_logger = logging.getLogger(__name__)
+
+# Outcome of LearningSystemAPI._cache_lookup
+CacheLookup = namedtuple('CacheLookup', 'response entry_key version headers data_format content_coding')
+
+# Largest page a client may request with ``limit``
+API_MAX_PAGE_SIZE = 500
+# Fields of /api/learning/sets, in output order ('id' is always returned)
+SET_LIST_FIELDS = ['name', 'description', 'full_text', 'vocabulary_count', 'sentence_count', 'user']
+
+
+def _stream_learning_data(dbname, snapshot, set_ids, fields, lookup, extra_headers):
+    """Yield the export of ``set_ids`` chunk by chunk, in the negotiated representation
+
+    The generator is consumed after the request cursor is closed, so it
+    reads through a cursor of its own, on the ``snapshot`` exported by the
+    request transaction: the body is the content of the version of the
+    ETag. The first ``next()`` only opens that cursor and yields an empty
+    chunk; it must be called while the request transaction is still open.
+    The streamed body is also stored in the response cache, unless it is
+    too large for it.
+    """
+    body_parts = []
+    body_size = 0
+    try:
+        with odoo.registry(dbname).cursor() as cr:
+            cr.execute("SET TRANSACTION SNAPSHOT %s", [snapshot])
+            yield b''
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            learning_sets = env['learning.set'].browse(set_ids).exists()
+            if lookup.data_format == 'msgpack':
+                unique_sets = learning_sets.browse(learning_sets._export_unique_ids())
+                chunks = wire_format.iter_msgpack_map(
+                    unique_sets._iter_export_items(fields=fields), len(unique_sets))
+            else:
+                chunks = (chunk.encode('utf-8') for chunk in learning_sets._iter_export_json(fields=fields))
+
+            for chunk in wire_format.iter_compress(chunks, lookup.content_coding):
+                if body_parts is not None:
+                    body_size += len(chunk)
+                    if body_size <= response_cache.max_bytes:
+                        body_parts.append(chunk)
+                    else:
+                        body_parts = None
+                yield chunk
+
+            if body_parts is not None:
+                response_cache.set(lookup.entry_key, (b''.join(body_parts), extra_headers), body_size)
+    except Exception:
+        # Headers are already sent, the client sees a truncated body
+        _logger.exception("Streaming learning data failed")
+        raise
 
 
 class LearningSystemAPI(http.Controller):
 
+    def _cache_lookup(self, cache_key, headers):
+        """Resolve a request against the versioned response cache
+
+        The response representation (JSON or MessagePack, identity, gzip or
+        brotli) is negotiated here and is part of both the ETag and the cache
+        entry key. Returns a :class:`CacheLookup`: ``response`` is set when
+        the request can be answered without building anything (304 or cache
+        hit), ``headers`` is completed with the representation and
+        validators.
+        """
+        data_format, content_coding = wire_format.negotiate(request.httprequest)
+        version = request.env['learning.content.version'].sudo()._get_version()
+        etag = make_etag(version, f'{cache_key}|{data_format}|{content_coding}')
+        headers = [header for header in headers if header[0] != 'Content-Type'] + [
+            ('Content-Type', wire_format.content_type(data_format)),
+            ('Vary', 'Accept, Accept-Encoding'),
+            ('ETag', f'"{etag}"'),
+            ('Cache-Control', 'public, no-cache'),
+            ('Access-Control-Expose-Headers', 'ETag, X-Next-After-Id'),
+        ]
+        if content_coding != 'identity':
+            headers.append(('Content-Encoding', content_coding))
+
+        entry_key = (request.db, cache_key, version, data_format, content_coding)
+        lookup = CacheLookup(None, entry_key, version, headers, data_format, content_coding)
+
+        if request.httprequest.if_none_match.contains_weak(etag):
+            return lookup._replace(response=request.make_response(b'', status=304, headers=headers))
+
+        entry = response_cache.get(entry_key)
+        if entry is None and content_coding != 'identity':
+            # Compress the plain body once and keep the result next to it
+            plain_entry = response_cache.get(entry_key[:-1] + ('identity',))
+            if plain_entry is not None:
+                body = wire_format.compress(plain_entry[0], content_coding)
+                entry = (body, plain_entry[1])
+                response_cache.set(entry_key, entry, len(body))
+        if entry is not None:
+            body, extra_headers = entry
+            return lookup._replace(response=request.make_response(body, headers=headers + extra_headers))
+
+        return lookup
+
+    def _cached_json_response(self, cache_key, build_response, headers):
+        """Serve data built by ``build_response`` from the versioned response cache
+
+        ``build_response`` returns ``(data, extra_headers)``. The cache entry
+        and the strong ETag are both keyed by the learning content version,
+        so unchanged content is neither rebuilt nor re-serialized, and a
+        matching If-None-Match gets a 304. Both the plain and the compressed
+        bodies are cached.
+        """
+        lookup = self._cache_lookup(cache_key, headers)
+        if lookup.response is not None:
+            return lookup.response
+
+        data, extra_headers = build_response()
+        body = wire_format.render(data, lookup.data_format)
+        if lookup.content_coding != 'identity':
+            plain_key = lookup.entry_key[:-1] + ('identity',)
+            response_cache.set(plain_key, (body, extra_headers), len(body))
+            body = wire_format.compress(body, lookup.content_coding)
+        response_cache.set(lookup.entry_key, (body, extra_headers), len(body))
+        return request.make_response(body, headers=lookup.headers + extra_headers)
+
+    def _parse_page_params(self, limit, after_id):
+        """Validate the ``limit``/``after_id`` query parameters"""
+        limit = int(limit) if limit not in (None, '') else None
+        after_id = int(after_id) if after_id not in (None, '') else None
+        if limit is not None and not 0 < limit <= API_MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {API_MAX_PAGE_SIZE}")
+        if after_id is not None and after_id < 0:
+            raise ValueError("after_id must be a positive integer")
+        return limit, after_id
+
+    def _next_page_headers(self, records, limit):
+        """Return the header carrying the cursor of the next page, if any"""
+        if limit and len(records) == limit:
+            return [('X-Next-After-Id', str(records[-1].id))]
+        return []
+
+    def _bad_request(self, message):
+        return request.make_response(
+            json.dumps({'error': 'Bad request', 'message': message}),
+            status=400,
+            headers=[('Content-Type', 'application/json')]
+        )
+
     @http.route('/api/learning/data', type='http', auth='public', methods=['GET'], csrf=False, cors='*')
-    def get_learning_data(self):
-        """API endpoint to get all learning data in JSON format"""
+    def get_learning_data(self, limit=None, after_id=None, fields=None, **kwargs):
+        """API endpoint to get all learning data in JSON format
+
+        Optional query parameters:
+        - ``limit`` / ``after_id``: cursor pagination over learning set ids,
+          the cursor of the next page is returned in ``X-Next-After-Id``
+        - ``fields``: comma separated projection, e.g.
+          ``fields=description,vocabulary.word,vocabulary.translation``
+        """
         try:
             learning_set_model = request.env['learning.set'].sudo()
-            data = learning_set_model.get_learning_data_api()
-            
-            return request.make_response(
-                json.dumps(data, indent=2, ensure_ascii=False),
-                headers=[
-                    ('Content-Type', 'application/json'),
-                    ('Access-Control-Allow-Origin', '*'),
-                    ('Access-Control-Allow-Methods', 'GET, POST, OPTIONS'),
-                    ('Access-Control-Allow-Headers', 'Content-Type'),
-                ]
-            )
+            try:
+                limit, after_id = self._parse_page_params(limit, after_id)
+                if fields is not None:
+                    fields = sorted({path.strip() for path in fields.split(',') if path.strip()})
+                    learning_set_model._parse_export_fields(fields)
+            except (ValueError, UserError) as e:
+                return self._bad_request(str(e))
+
+            cache_key = 'data'
+            if limit or after_id or fields is not None:
+                cache_key = f"data?limit={limit or ''}&after_id={after_id or ''}&fields={','.join(fields or [])}"
+                if fields is None:
+                    cache_key += '*'
+
+            headers = [
+                ('Content-Type', 'application/json'),
+                ('Access-Control-Allow-Origin', '*'),
+                ('Access-Control-Allow-Methods', 'GET, POST, OPTIONS'),
+                ('Access-Control-Allow-Headers', 'Content-Type'),
+            ]
+            lookup = self._cache_lookup(cache_key, headers)
+            if lookup.response is not None:
+                return lookup.response
+
+            # Cache miss: stream the payload one learning set at a time
+            # (no Content-Length, so it goes out with chunked encoding)
+            learning_sets = learning_set_model._search_api_page(limit=limit, after_id=after_id)
+            extra_headers = self._next_page_headers(learning_sets, limit)
+            # The body is read later on the snapshot of this transaction, the
+            # one the version of the ETag and the page were read from
+            request.env.cr.execute("SELECT pg_export_snapshot()")
+            snapshot = request.env.cr.fetchone()[0]
+            body = _stream_learning_data(request.db, snapshot, learning_sets.ids, fields, lookup, extra_headers)
+            next(body)  # import the snapshot while it is still exported
+            return request.make_response(body, headers=lookup.headers + extra_headers)
         except Exception as e:
             error_response = {
                 'error': 'Failed to fetch learning data',
@@ -33,25 +213,34 @@ class LearningSystemAPI(http.Controller):
             )
 
     @http.route('/api/learning/sets', type='http', auth='public', methods=['GET'], csrf=False, cors='*')
-    def get_learning_sets(self):
-        """API endpoint to get learning sets metadata"""
+    def get_learning_sets(self, limit=None, after_id=None, fields=None, **kwargs):
+        """API endpoint to get learning sets metadata
+
+        Accepts the same ``limit``/``after_id`` pagination as
+        ``/api/learning/data``; ``fields`` selects among
+        ``name,description,full_text,vocabulary_count,sentence_count,user``.
+        """
         try:
-            learning_sets = request.env['learning.set'].sudo().search([('active', '=', True)])
-            sets_data = []
-            
-            for learning_set in learning_sets:
-                sets_data.append({
-                    'id': learning_set.id,
-                    'name': learning_set.name,
-                    'description': learning_set.description,
-                    'full_text': learning_set.full_text,
-                    'vocabulary_count': learning_set.vocabulary_count,
-                    'sentence_count': learning_set.sentence_count,
-                    'user': learning_set.user
-                })
-            
-            return request.make_response(
-                json.dumps(sets_data, indent=2, ensure_ascii=False),
+            try:
+                limit, after_id = self._parse_page_params(limit, after_id)
+                read_fields = SET_LIST_FIELDS
+                if fields is not None:
+                    requested = {name.strip() for name in fields.split(',') if name.strip()}
+                    unknown = requested - set(SET_LIST_FIELDS) - {'id'}
+                    if unknown:
+                        raise ValueError(f"unknown fields: {', '.join(sorted(unknown))}")
+                    read_fields = [name for name in SET_LIST_FIELDS if name in requested]
+            except ValueError as e:
+                return self._bad_request(str(e))
+
+            def build_response():
+                learning_sets = request.env['learning.set'].sudo()._search_api_page(limit=limit, after_id=after_id)
+                sets_data = learning_sets.read(read_fields, load=None)
+                return sets_data, self._next_page_headers(learning_sets, limit)
+
+            return self._cached_json_response(
+                f"sets?limit={limit or ''}&after_id={after_id or ''}&fields={','.join(read_fields)}",
+                build_response,
                 headers=[
                     ('Content-Type', 'application/json'),
                     ('Access-Control-Allow-Origin', '*'),
@@ -69,8 +258,11 @@ class LearningSystemAPI(http.Controller):
             )
 
     @http.route('/api/learning/set/<int:set_id>', type='http', auth='public', methods=['GET'], csrf=False, cors='*')
-    def get_learning_set(self, set_id):
-        """API endpoint to get specific learning set data"""
+    def get_learning_set(self, set_id, fields=None, **kwargs):
+        """API endpoint to get specific learning set data
+
+        Accepts the same ``fields`` projection as ``/api/learning/data``.
+        """
         try:
             learning_set = request.env['learning.set'].sudo().browse(set_id)
             if not learning_set.exists():
@@ -79,11 +271,21 @@ class LearningSystemAPI(http.Controller):
                     status=404,
                     headers=[('Content-Type', 'application/json')]
                 )
-            
-            data = learning_set.export_to_json()
-            
-            return request.make_response(
-                json.dumps(data, indent=2, ensure_ascii=False),
+
+            try:
+                if fields is not None:
+                    fields = sorted({path.strip() for path in fields.split(',') if path.strip()})
+                    learning_set._parse_export_fields(fields)
+            except UserError as e:
+                return self._bad_request(str(e))
+
+            cache_key = f'set/{set_id}'
+            if fields is not None:
+                cache_key += f"?fields={','.join(fields)}"
+
+            return self._cached_json_response(
+                cache_key,
+                lambda: (learning_set.export_to_json(fields=fields), []),
                 headers=[
                     ('Content-Type', 'application/json'),
                     ('Access-Control-Allow-Origin', '*'),
@@ -100,6 +302,42 @@ class LearningSystemAPI(http.Controller):
                 headers=[('Content-Type', 'application/json')]
             )
 
+    @http.route('/api/learning/changes', type='http', auth='public', methods=['GET'], csrf=False, cors='*')
+    def get_learning_changes(self, since=None, **kwargs):
+        """API endpoint for delta sync of the learning content
+
+        Returns the content changed since the ``token`` of the previous call
+        (pass it back as ``since``). Not cached: the answer depends on the
+        token and is small once a client is in sync.
+        """
+        try:
+            try:
+                data = request.env['learning.set'].sudo().get_changes_api(since=since or None)
+            except UserError as e:
+                return self._bad_request(str(e))
+
+            data_format, content_coding = wire_format.negotiate(request.httprequest)
+            body = wire_format.compress(wire_format.render(data, data_format), content_coding)
+            headers = [
+                ('Content-Type', wire_format.content_type(data_format)),
+                ('Access-Control-Allow-Origin', '*'),
+                ('Cache-Control', 'no-cache'),
+                ('Vary', 'Accept, Accept-Encoding'),
+            ]
+            if content_coding != 'identity':
+                headers.append(('Content-Encoding', content_coding))
+            return request.make_response(body, headers=headers)
+        except Exception as e:
+            error_response = {
+                'error': 'Failed to fetch learning changes',
+                'message': str(e)
+            }
+            return request.make_response(
+                json.dumps(error_response),
+                status=500,
+                headers=[('Content-Type', 'application/json')]
+            )
+
     @http.route('/api/learning/progress', type='json', auth='public', methods=['POST'], csrf=False, cors='*')
     def save_learning_progress(self):
         """API endpoint to save learning progress (future implementation)"""
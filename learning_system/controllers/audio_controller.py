@@ -1,6 +1,6 @@
 from odoo import http
 from odoo.http import request
-import base64
+import json
 import mimetypes
 import logging
 
@@ -15,65 +15,125 @@ class AudioController(http.Controller):
         """
         公开接口：获取学习集的音频文件
         支持跨域访问，无需认证
-        如果音频文件不存在，自动生成音频
+        支持 Range 请求（206 Partial Content），便于浏览器拖动播放进度
+        如果音频文件不存在，创建后台生成任务并返回 202 Accepted，
+        响应中的 statusUrl 可查询生成进度（同一学习集的并发请求共用一个任务）
         """
         try:
-            # 查找学习集记录
-            learning_set = request.env['learning.set'].sudo().browse(learning_set_id)
+            # 查找学习集记录（bin_size: 只判断音频是否存在，不加载内容）
+            learning_set = request.env['learning.set'].sudo().with_context(bin_size=True).browse(learning_set_id)
             
             if not learning_set.exists():
                 return request.not_found("学习集不存在")
             
-            # 如果音频文件不存在，尝试自动生成
+            # 如果音频文件不存在，加入后台生成队列，返回 202 和任务状态地址
             if not learning_set.audio_file:
-                _logger.info(f"音频文件不存在，尝试为学习集 {learning_set_id} 自动生成音频")
-                
                 # 检查是否有完整文本内容
                 if not learning_set.full_text:
                     _logger.warning(f"学习集 {learning_set_id} 没有完整文本内容，无法生成音频")
                     return request.not_found("音频文件不存在且无法自动生成：缺少文本内容")
                 
-                try:
-                    # 调用音频生成方法（使用内部方法，不返回UI动作）
-                    _logger.info(f"开始为学习集 {learning_set_id} 生成音频...")
-                    learning_set.generate_txt2audio()
-                    
-                    # 重新获取记录以获取生成的音频文件
-                    learning_set = request.env['learning.set'].sudo().browse(learning_set_id)
-                    
-                    if not learning_set.audio_file:
-                        _logger.error(f"学习集 {learning_set_id} 音频生成失败")
-                        return request.not_found("音频文件生成失败")
-                    
-                    _logger.info(f"学习集 {learning_set_id} 音频生成成功")
-                    
-                except Exception as gen_error:
-                    _logger.error(f"学习集 {learning_set_id} 音频生成异常: {str(gen_error)}")
-                    return request.not_found(f"音频文件自动生成失败: {str(gen_error)}")
-            
-            # 解码音频文件内容
-            audio_content = base64.b64decode(learning_set.audio_file)
-            
-            # 设置响应头
+                data = request.env['learning.audio.job'].sudo()._enqueue(learning_set)
+                return self._job_status_response(data, status=202)
+            
+            # 由 ir.binary 构造文件流：直接读取 filestore 文件，
+            # werkzeug 按 Range/If-None-Match 只发送请求的字节区间；
+            # 配置 x_sendfile 时由前端服务器（nginx X-Accel-Redirect）发送文件
             filename = learning_set.audio_filename or f"audio_{learning_set_id}.mp3"
             content_type = mimetypes.guess_type(filename)[0] or 'audio/mpeg'
-            
-            headers = [
-                ('Content-Type', content_type),
-                ('Content-Length', len(audio_content)),
-                ('Content-Disposition', f'inline; filename="{filename}"'),
-                ('Cache-Control', 'public, max-age=3600'),  # 缓存1小时
-                ('Access-Control-Allow-Origin', '*'),  # 允许跨域
-                ('Access-Control-Allow-Methods', 'GET'),
-                ('Access-Control-Allow-Headers', 'Content-Type'),
-            ]
-            
-            return request.make_response(audio_content, headers=headers)
+            stream = request.env['ir.binary']._get_stream_from(
+                learning_set.with_context(bin_size=False), 'audio_file',
+                filename=filename, mimetype=content_type)
+            stream.max_age = 3600  # 缓存1小时
+            
+            response = stream.get_response(as_attachment=False)
+            response.headers['Accept-Ranges'] = 'bytes'
+            response.headers['Access-Control-Allow-Origin'] = '*'  # 允许跨域
+            response.headers['Access-Control-Allow-Methods'] = 'GET'
+            response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Range'
+            response.headers['Access-Control-Expose-Headers'] = 'Accept-Ranges, Content-Range, Content-Length'
+            return response
             
         except Exception as e:
             _logger.error(f"获取音频文件失败 ID={learning_set_id}: {str(e)}")
             return request.not_found(f"音频文件访问失败: {str(e)}")
     
+    @http.route('/api/learning/audio/<int:learning_set_id>/index', 
+                type='http', auth='public', methods=['GET'], csrf=False, cors='*')
+    def get_audio_index(self, learning_set_id, **kwargs):
+        """
+        公开接口：获取学习集音频的分段时间索引
+        每段包含在整段音频中的字节/时间范围、对应句子，以及单独播放该段的地址
+        """
+        learning_set = request.env['learning.set'].sudo().browse(learning_set_id)
+        if not learning_set.exists():
+            return request.make_response(
+                json.dumps({'error': 'Learning set not found'}),
+                status=404,
+                headers=[('Content-Type', 'application/json'), ('Access-Control-Allow-Origin', '*')]
+            )
+        base_url = request.env['ir.config_parameter'].sudo().get_param('web.base.url')
+        data = {
+            'learningSetId': learning_set.id,
+            'audioUrl': learning_set.audio_url or None,
+            'segments': learning_set.audio_segment_ids._get_index_data(base_url),
+        }
+        return request.make_response(json.dumps(data, ensure_ascii=False), headers=[
+            ('Content-Type', 'application/json'),
+            ('Cache-Control', 'no-cache'),
+            ('Access-Control-Allow-Origin', '*'),
+        ])
+    
+    @http.route('/api/learning/audio/segment/<int:segment_id>', 
+                type='http', auth='public', methods=['GET'], csrf=False, cors='*')
+    def get_audio_segment(self, segment_id, **kwargs):
+        """
+        公开接口：获取单个音频分段（例如一个句子）的 MP3
+        只从 filestore 读取该段的字节范围，支持 Range 请求
+        """
+        segment = request.env['learning.audio.segment'].sudo().browse(segment_id)
+        if not segment.exists():
+            return request.not_found("音频分段不存在")
+        
+        content = segment.learning_set_id._read_audio_range(segment.start_offset, segment.end_offset)
+        response = request.make_response(content, headers=[
+            ('Content-Type', 'audio/mpeg'),
+            ('Content-Disposition', f'inline; filename="segment_{segment_id}.mp3"'),
+            ('Cache-Control', 'public, max-age=3600'),
+            ('Access-Control-Allow-Origin', '*'),
+            ('Access-Control-Allow-Headers', 'Content-Type, Range'),
+            ('Access-Control-Expose-Headers', 'Accept-Ranges, Content-Range, Content-Length'),
+        ])
+        response.set_etag(f"{segment.id}-{segment.learning_set_id.write_date.timestamp()}")
+        return response.make_conditional(request.httprequest, accept_ranges=True, complete_length=len(content))
+    
+    @http.route('/api/learning/audio/job/<int:job_id>', 
+                type='http', auth='public', methods=['GET'], csrf=False, cors='*')
+    def get_audio_job(self, job_id, **kwargs):
+        """
+        公开接口：查询音频生成任务状态
+        """
+        job = request.env['learning.audio.job'].sudo().browse(job_id)
+        if not job.exists():
+            return request.make_response(
+                json.dumps({'error': 'Audio job not found'}),
+                status=404,
+                headers=[('Content-Type', 'application/json'), ('Access-Control-Allow-Origin', '*')]
+            )
+        return self._job_status_response(job._get_status_data())
+    
+    def _job_status_response(self, data, status=200):
+        """Return the JSON status ``data`` of an audio job, with the polling headers"""
+        data['statusUrl'] = f"/api/learning/audio/job/{data['jobId']}"
+        headers = [
+            ('Content-Type', 'application/json'),
+            ('Cache-Control', 'no-store'),
+            ('Access-Control-Allow-Origin', '*'),
+        ]
+        if data['status'] in ('pending', 'running'):
+            headers += [('Location', data['statusUrl']), ('Retry-After', '5')]
+        return request.make_response(json.dumps(data), status=status, headers=headers)
+    
     @http.route('/api/learning/audio/test/<int:learning_set_id>', 
                 type='json', auth='public', methods=['GET'], csrf=False, cors='*')
     def test_audio_access(self, learning_set_id, **kwargs):
@@ -81,7 +141,7 @@ class AudioController(http.Controller):
         测试接口：检查音频文件是否可访问
         """
         try:
-            learning_set = request.env['learning.set'].sudo().browse(learning_set_id)
+            learning_set = request.env['learning.set'].sudo().with_context(bin_size=True).browse(learning_set_id)
             
             if not learning_set.exists():
                 return {'status': 'error', 'message': '学习集不存在'}
@@ -102,7 +162,7 @@ class AudioController(http.Controller):
                 result.update({
                     'audio_filename': learning_set.audio_filename,
                     'audio_url': learning_set.audio_url,
-                    'file_size': len(base64.b64decode(learning_set.audio_file))
+                    'file_size': learning_set._get_audio_attachment().file_size
                 })
             
             return result
@@ -138,7 +198,7 @@ class AudioController(http.Controller):
                     'learning_set_id': learning_set_id,
                     'audio_filename': learning_set.audio_filename,
                     'audio_url': learning_set.audio_url,
-                    'file_size': len(base64.b64decode(learning_set.audio_file)) if learning_set.audio_file else 0
+                    'file_size': learning_set._get_audio_attachment().file_size
                 }
                 
             except Exception as gen_error:
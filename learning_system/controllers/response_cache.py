@@ -0,0 +1,59 @@
+from collections import OrderedDict
+import hashlib
+import threading
+
+
+class ResponseCache:
+    """Per-process LRU cache of serialized API responses, bounded in bytes.
+
+    Entries are keyed by (database, request key, content version), so a new
+    content version simply makes the old entries unreachable until they are
+    evicted.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entries=256):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, size):
+        """Store ``value`` under ``key``, accounting ``size`` bytes for it"""
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous[1]
+            self._entries[key] = (value, size)
+            self._size += size
+            while self._entries and (self._size > self.max_bytes or len(self._entries) > self.max_entries):
+                _key, (_value, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+def make_etag(version, key):
+    """Return the (unquoted) strong ETag of a response for a content version
+
+    The serialized body is fully determined by the request key and the
+    content version, so hashing those is enough and does not require the
+    body to be rendered first.
+    """
+    return hashlib.sha1(f"{version}:{key}".encode()).hexdigest()
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,81 @@
+import json
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPES = ['application/msgpack', 'application/x-msgpack']
+
+
+def negotiate(httprequest):
+    """Pick the ``(format, content coding)`` of a response from the request headers
+
+    ``format`` is 'json' or 'msgpack' (only when msgpack is installed and
+    explicitly preferred by ``Accept``), ``content coding`` is 'br', 'gzip'
+    or 'identity' according to ``Accept-Encoding``.
+    """
+    data_format = 'json'
+    if msgpack is not None:
+        offers = [JSON_MIMETYPE] + MSGPACK_MIMETYPES
+        if httprequest.accept_mimetypes.best_match(offers, default=JSON_MIMETYPE) in MSGPACK_MIMETYPES:
+            data_format = 'msgpack'
+
+    codings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    content_coding = httprequest.accept_encodings.best_match(codings) or 'identity'
+    return data_format, content_coding
+
+
+def content_type(data_format):
+    return MSGPACK_MIMETYPES[0] if data_format == 'msgpack' else JSON_MIMETYPE
+
+
+def render(data, data_format):
+    """Serialize ``data`` in the given format (JSON stays pretty-printed for compatibility)"""
+    if data_format == 'msgpack':
+        return msgpack.packb(data, use_bin_type=True)
+    return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+
+
+def iter_msgpack_map(items, length):
+    """Serialize ``(key, value)`` items as one MessagePack map, item by item"""
+    packer = msgpack.Packer(use_bin_type=True)
+    yield packer.pack_map_header(length)
+    for key, value in items:
+        yield packer.pack(key) + packer.pack(value)
+
+
+def _compressor(content_coding):
+    if content_coding == 'br':
+        compressor = brotli.Compressor(quality=5)
+        return compressor.process, compressor.flush, compressor.finish
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+
+
+def compress(body, content_coding):
+    """Return ``body`` encoded with ``content_coding``"""
+    if content_coding == 'identity':
+        return body
+    process, _flush, finish = _compressor(content_coding)
+    return process(body) + finish()
+
+
+def iter_compress(chunks, content_coding):
+    """Encode a stream of chunks, flushing after each one so it reaches the client right away"""
+    if content_coding == 'identity':
+        yield from chunks
+        return
+    process, flush, finish = _compressor(content_coding)
+    for chunk in chunks:
+        data = process(chunk) + flush()
+        if data:
+            yield data
+    yield finish()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import base64
+import logging
+
+from odoo import api, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """
+    Migration script to copy legacy audio_file column values into filestore attachments
+
+    Rows are converted one at a time so that only one audio file is held in
+    memory, then the legacy column is dropped.
+    """
+    if not version:
+        return
+
+    cr.execute("""
+        SELECT 1
+        FROM information_schema.columns
+        WHERE table_name = 'learning_set'
+        AND column_name = 'audio_file_legacy'
+    """)
+    if not cr.fetchone():
+        return
+
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    Attachment = env['ir.attachment']
+
+    cr.execute("SELECT id FROM learning_set WHERE audio_file_legacy IS NOT NULL ORDER BY id")
+    set_ids = [row[0] for row in cr.fetchall()]
+    for set_id in set_ids:
+        cr.execute("SELECT audio_file_legacy FROM learning_set WHERE id = %s", [set_id])
+        value = cr.fetchone()[0]
+        # Binary columns hold the base64 text of the file
+        content = base64.b64decode(bytes(value))
+        Attachment.create({
+            'name': 'audio_file',
+            'res_model': 'learning.set',
+            'res_field': 'audio_file',
+            'res_id': set_id,
+            'type': 'binary',
+            'raw': content,
+        })
+        Attachment.invalidate_model()
+        _logger.info("学习集 %s 音频已迁移到附件存储 (%s 字节)", set_id, len(content))
+
+    cr.execute("ALTER TABLE learning_set DROP COLUMN audio_file_legacy")
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+
+def migrate(cr, version):
+    """
+    Migration script to move learning_set.audio_file from a table column to filestore attachments
+
+    The column is renamed here so the registry does not touch it; the
+    post-migration copies its content into ir.attachment.
+    """
+    if not version:
+        return
+
+    cr.execute("""
+        SELECT 1
+        FROM information_schema.columns
+        WHERE table_name = 'learning_set'
+        AND column_name = 'audio_file'
+    """)
+    if cr.fetchone():
+        cr.execute("ALTER TABLE learning_set RENAME COLUMN audio_file TO audio_file_legacy")
@@ -1,3 +1,4 @@
+from . import content_version
 from . import learning_set
 from . import vocabulary
 from . import cue
@@ -5,4 +6,12 @@ from . import sentence
 from . import import_wizard
 from . import ai_config
 from . import ai_generator
-from . import collection
\ No newline at end of file
+from . import collection
+from . import audio_job
+from . import tts_cache
+from . import audio_segment
+from . import ai_job
+from . import ai_response_cache
+from . import ai_rate_limit
+from . import ai_price
+from . import import_job
@@ -1,16 +1,64 @@
+import odoo
 from odoo import models, fields, api
 from odoo.exceptions import UserError, ValidationError
-import requests
+from . import http_pool
+from .json_stream import iter_sse_data, JsonArrayParser
+from .token_counter import count_tokens
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import json
 import logging
+import random
+import requests
+import time
+from urllib.parse import urlsplit
 
 _logger = logging.getLogger(__name__)
 
 
+def call_ai_api_in_thread(dbname, uid, context, config_id, prompt, on_item=None):
+    """Call the AI API of config ``config_id`` from a worker thread, with a cursor of its own
+
+    With ``on_item``, a configuration that streams responses calls it with
+    each complete object of the JSON array of the completion as soon as it
+    arrives (to report progress); the full response is still returned.
+
+    :return: ``(response, response time in seconds, token usage)``
+    """
+    with odoo.registry(dbname).cursor() as cr:
+        config = api.Environment(cr, uid, context)['learning.ai.config'].browse(config_id)
+        start_time = time.time()
+        usage = {}
+        if on_item and config.stream_enabled:
+            parser = JsonArrayParser()
+            chunks = []
+            for chunk in config._stream_ai_api(prompt, usage=usage):
+                chunks.append(chunk)
+                for item in parser.feed(chunk):
+                    on_item(item)
+            response = ''.join(chunks)
+        else:
+            response = config._call_ai_api(prompt, usage=usage)
+        return response, round(time.time() - start_time, 2), usage
+
+
+def call_ai_attempt_in_thread(dbname, uid, context, config_id, prompt):
+    """Call the provider of config ``config_id`` with its retry policy only (no cache, no failover)
+    from a worker thread, with a cursor of its own
+
+    :return: ``(response, token usage)``
+    """
+    with odoo.registry(dbname).cursor() as cr:
+        config = api.Environment(cr, uid, context)['learning.ai.config'].browse(config_id)
+        usage = {}
+        response = config._call_ai_api_with_retry(prompt, usage=usage)
+        return response, usage
+
+
 class AIConfig(models.Model):
     _name = 'learning.ai.config'
     _description = 'AI API Configuration'
     _rec_name = 'provider_name'
+    _order = 'sequence, id'
 
     provider_name = fields.Char('Provider Name', required=True, help="AI服务提供商名称")
     provider_type = fields.Selection([
@@ -40,6 +88,50 @@ class AIConfig(models.Model):
     ], string='Test Status', default='not_tested', readonly=True)
     test_message = fields.Text('Test Message', readonly=True)
 
+    # Bulk generation
+    max_concurrency = fields.Integer('Max Concurrency', default=2,
+                                     help="批量AI生成时，同时生成的学习集数量上限（每个学习集同时发出词汇和句子两个请求）")
+
+    # Connection pool
+    http_pool_stats = fields.Text('Connection Pool', compute='_compute_http_pool_stats',
+                                  help="本进程到该API主机的连接复用统计")
+
+    # Rate limits, shared by all Odoo workers
+    rate_limit_rpm = fields.Integer('Requests per Minute', default=0, help="每分钟最多请求数（0表示不限制）")
+    rate_limit_tpm = fields.Integer('Tokens per Minute', default=0,
+                                    help="每分钟最多token数（0表示不限制），每次请求按提示词估算值加Max Tokens计")
+    max_parallel_requests = fields.Integer('Max Parallel Requests', default=4,
+                                           help="同时进行的API请求上限（0表示不限制）；收到429时自动减半，之后逐步恢复")
+    rate_limit_max_wait = fields.Integer('Max Wait (seconds)', default=120,
+                                         help="等待速率限制的最长时间，超过则本次请求失败")
+    rate_limit_status = fields.Text('Rate Limit Status', compute='_compute_rate_limit_status')
+
+    # Retries and failover
+    retry_max_attempts = fields.Integer('Max Attempts', default=3, help="每次调用的最多尝试次数（含第一次）")
+    retry_backoff = fields.Float('Retry Backoff (seconds)', default=1.0, help="第一次重试前的等待时间，之后每次加倍")
+    retry_backoff_max = fields.Float('Max Backoff (seconds)', default=30.0, help="重试等待时间的上限")
+    retry_jitter = fields.Boolean('Jitter', default=True, help="在0到退避时间之间随机等待，避免多个请求同时重试")
+    retry_statuses = fields.Char('Retryable Statuses', default='429,5xx',
+                                 help="可重试的HTTP状态码，逗号分隔，5xx表示一类；连接错误和超时总是重试")
+    sequence = fields.Integer('Sequence', default=10, help="故障转移顺序")
+    use_for_failover = fields.Boolean('Use for Failover', default=False,
+                                      help="其他AI服务重试后仍失败时，按顺序改用本服务")
+    hedge_delay = fields.Float('Hedge After (seconds)', default=0,
+                               help="超过该时间未响应时，同时向故障转移链中的下一个服务发出相同请求，"
+                                    "采用先返回的结果（0表示不启用）")
+
+    # Streaming
+    stream_enabled = fields.Boolean('Stream Responses', default=False,
+                                    help="AI生成任务使用流式响应，生成过程中实时通知已生成的词汇和句子数量")
+
+    # Response cache
+    cache_enabled = fields.Boolean('Cache Responses', default=False,
+                                   help="相同参数和提示词的请求直接返回缓存的响应，不再调用API")
+    cache_ttl_hours = fields.Integer('Cache TTL (hours)', default=168, help="缓存响应的有效时间（小时）")
+    cache_max_entries = fields.Integer('Cache Size', default=1000, help="最多缓存的响应数量，超出时淘汰最久未使用的")
+    cache_hit_count = fields.Integer('Cache Hits', readonly=True, default=0)
+    cache_miss_count = fields.Integer('Cache Misses', readonly=True, default=0)
+
     @api.constrains('is_default')
     def _check_default_provider(self):
         """Ensure only one default provider"""
@@ -48,6 +140,41 @@ class AIConfig(models.Model):
             if other_defaults:
                 raise ValidationError("只能设置一个默认AI服务提供商")
 
+    def _compute_http_pool_stats(self):
+        stats = http_pool.get_stats()
+        for record in self:
+            host_stats = None
+            if record.api_url:
+                parts = urlsplit(record.api_url)
+                host_stats = stats.get(f"{parts.scheme}://{parts.netloc}")
+            if host_stats:
+                record.http_pool_stats = (
+                    f"请求数: {host_stats['requests']}，新建连接: {host_stats['connections']}，"
+                    f"复用率: {host_stats['reuse_ratio']:.1%}（当前进程）"
+                )
+            else:
+                record.http_pool_stats = "当前进程尚无请求"
+
+    @api.constrains('retry_statuses')
+    def _check_retry_statuses(self):
+        for record in self:
+            try:
+                self._parse_retry_statuses(record.retry_statuses)
+            except ValueError as e:
+                raise ValidationError(f"无效的可重试状态码：{e}（示例：429,502,5xx）")
+
+    def _compute_rate_limit_status(self):
+        RateLimit = self.env['learning.ai.rate.limit'].sudo()
+        for record in self:
+            state = RateLimit.search([('ai_config_id', '=', record.id)], limit=1) if record.id else RateLimit
+            if not state:
+                record.rate_limit_status = "尚无请求"
+                continue
+            status = f"当前并发上限: {max(1, int(state.concurrency))}，累计429次数: {state.throttled_count}"
+            if state.cooldown_until and state.cooldown_until > fields.Datetime.now():
+                status += f"，暂停请求至 {fields.Datetime.to_string(state.cooldown_until)} (UTC)"
+            record.rate_limit_status = status
+
     def name_get(self):
         result = []
         for record in self:
@@ -59,7 +186,7 @@ class AIConfig(models.Model):
         """Test AI API connection"""
         try:
             test_prompt = "请回复：连接测试成功"
-            response = self._call_ai_api(test_prompt)
+            response = self._call_ai_api_with_retry(test_prompt)
             
             if response:
                 self.test_status = 'success'
@@ -89,24 +216,465 @@ class AIConfig(models.Model):
                 }
             }
 
-    def _call_ai_api(self, prompt):
-        """Call AI API with given prompt"""
+    def _call_ai_api(self, prompt, usage=None):
+        """Call AI API with given prompt: response cache when enabled, then retries and failover
+
+        :param usage: optional dict filled with the token usage of the call
+            (see ``_update_usage``); a cached response uses no tokens
+        """
+        self.ensure_one()
+        usage = {} if usage is None else usage
+        Cache = self.env['learning.ai.response.cache'].sudo()
+        key = None
+        if self.cache_enabled:
+            key = Cache._make_key(self, prompt)
+            response = Cache._lookup(self, key)
+            self._count_cache_access(hit=response is not None)
+            if response is not None:
+                _logger.info(f"AI响应缓存命中 (AI提供商: {self.provider_name})")
+                usage.update(input_tokens=0, output_tokens=0, cached_tokens=0, source='cache', config_id=self.id)
+                return response
+        response, config = self._call_ai_api_failover(prompt, usage)
+        config._complete_usage(usage, prompt, response)
+        # A failover provider's answer is not the answer of this configuration's model
+        if key and response and config == self:
+            Cache._store(self, key, response)
+        return response
+
+    def _count_cache_access(self, hit):
+        """Count a cache hit or miss in a short transaction of its own
+
+        The caller's transaction stays open during the API call; updating
+        the configuration row in it would lock the row for every other call
+        of the configuration. READ COMMITTED: concurrent increments wait for
+        each other instead of failing to serialize.
+        """
+        column = 'cache_hit_count' if hit else 'cache_miss_count'
+        with self.env.registry.cursor() as cr:
+            cr.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+            cr.execute(f"UPDATE learning_ai_config SET {column} = {column} + 1 WHERE id = %s", [self.id])
+
+    def action_clear_cache(self):
+        """Drop the cached responses and reset the counters (UI action)"""
+        self.env['learning.ai.response.cache'].sudo().search([('ai_config_id', 'in', self.ids)]).unlink()
+        self.write({'cache_hit_count': 0, 'cache_miss_count': 0})
+
+    def _get_failover_chain(self):
+        """Return this configuration followed by the active failover configurations, in sequence order"""
+        self.ensure_one()
+        return self | self.search([('use_for_failover', '=', True), ('id', '!=', self.id)])
+
+    def _call_ai_api_failover(self, prompt, usage):
+        """Call the providers of the failover chain in order until one answers
+
+        :return: ``(response, configuration that answered)``
+        """
+        chain = self._get_failover_chain()
+        errors = []
+        if self.hedge_delay > 0 and len(chain) > 1:
+            result = self._call_ai_api_hedged(prompt, chain[1], errors, usage)
+            if result:
+                return result
+            chain = chain[2:]
+        for config in chain:
+            try:
+                return config._call_ai_api_with_retry(prompt, usage), config
+            except Exception as e:
+                errors.append((config, e))
+                _logger.error(f"AI API调用失败 ({config.provider_name}): {str(e)}")
+        self._raise_ai_errors(errors)
+
+    def _raise_ai_errors(self, errors):
+        """Raise the UserError summing up ``errors``, a list of ``(configuration, exception)``"""
+        if len(errors) == 1:
+            raise UserError(errors[0][0]._describe_ai_error(errors[0][1]))
+        raise UserError("所有AI服务均调用失败：" + "；".join(
+            f"{config.provider_name}: {config._describe_ai_error(error)}" for config, error in errors))
+
+    def _stream_ai_api(self, prompt, usage=None):
+        """Yield the completion of ``prompt`` in chunks, as the provider streams it
+
+        Goes through the response cache like ``_call_ai_api`` (a cached
+        response is yielded at once). Retries and failover only apply
+        until the first chunk arrives: after that, the caller may already
+        have used part of the completion. Hedging is not used.
+        """
+        self.ensure_one()
+        usage = {} if usage is None else usage
+        Cache = self.env['learning.ai.response.cache'].sudo()
+        key = None
+        if self.cache_enabled:
+            key = Cache._make_key(self, prompt)
+            response = Cache._lookup(self, key)
+            self._count_cache_access(hit=response is not None)
+            if response is not None:
+                usage.update(input_tokens=0, output_tokens=0, cached_tokens=0, source='cache', config_id=self.id)
+                yield response
+                return
+
+        errors = []
+        for config in self._get_failover_chain():
+            attempt = 1
+            while True:
+                chunks = []
+                try:
+                    for chunk in config._stream_ai_api_once(prompt, usage):
+                        chunks.append(chunk)
+                        yield chunk
+                except Exception as e:
+                    if chunks:
+                        _logger.error(f"AI流式响应中断 ({config.provider_name}): {str(e)}")
+                        raise UserError(config._describe_ai_error(e))
+                    if attempt < max(config.retry_max_attempts, 1) and config._is_retryable_error(e):
+                        delay = config._get_retry_delay(attempt, e)
+                        _logger.warning(f"AI服务 {config.provider_name} 第 {attempt} 次请求失败，"
+                                        f"{delay:.1f}秒后重试: {str(e)}")
+                        time.sleep(delay)
+                        attempt += 1
+                        continue
+                    errors.append((config, e))
+                    _logger.error(f"AI API调用失败 ({config.provider_name}): {str(e)}")
+                    break
+                response = ''.join(chunks)
+                config._complete_usage(usage, prompt, response)
+                if key and response and config == self:
+                    Cache._store(self, key, response)
+                return
+        self._raise_ai_errors(errors)
+
+    def _stream_ai_api_once(self, prompt, usage=None):
+        """Yield the chunks of one streamed call, within the rate limits of the configuration
+
+        Providers without a known streaming API (custom) yield the whole
+        completion as one chunk.
+        """
+        RateLimit = self.env['learning.ai.rate.limit'].sudo()
+        with RateLimit._reserve(self, self._estimate_request_tokens(prompt)):
+            stream_request = self._get_stream_request(prompt)
+            if not stream_request:
+                try:
+                    response_text = self._call_custom_api(prompt, usage)
+                except requests.HTTPError as e:
+                    self._record_throttling(e)
+                    raise
+                yield response_text
+            else:
+                url, headers, data, extract_text = stream_request
+                response = http_pool.post(url, headers=headers, json=data, timeout=self.timeout, stream=True)
+                try:
+                    try:
+                        response.raise_for_status()
+                    except requests.HTTPError as e:
+                        self._record_throttling(e)
+                        raise
+                    response.encoding = 'utf-8'
+                    for event in iter_sse_data(response.iter_lines(decode_unicode=True)):
+                        if event == '[DONE]':
+                            break
+                        event = json.loads(event)
+                        # Claude sends the input usage in the message of its first event
+                        self._update_usage(usage, event.get('message') if event.get('type') == 'message_start'
+                                           else event)
+                        text = extract_text(event)
+                        if text:
+                            yield text
+                finally:
+                    response.close()
+        RateLimit._record_result(self)
+
+    def _get_stream_request(self, prompt):
+        """Return ``(url, headers, json body, function extracting the text of an event)`` of a streamed call
+
+        Returns None for providers without a known streaming API.
+        """
+        if self.provider_type in ('openai', 'deepseek'):
+            default_model = 'gpt-3.5-turbo' if self.provider_type == 'openai' else 'deepseek-chat'
+            headers = {'Authorization': f'Bearer {self.api_key}', 'Content-Type': 'application/json'}
+            data = {
+                'model': self.model_name or default_model,
+                'messages': [{'role': 'user', 'content': prompt}],
+                'max_tokens': self.max_tokens,
+                'temperature': self.temperature,
+                'stream': True,
+                'stream_options': {'include_usage': True},
+            }
+            return self.api_url, headers, data, self._extract_openai_stream_text
+        if self.provider_type == 'claude':
+            headers = {
+                'x-api-key': self.api_key,
+                'Content-Type': 'application/json',
+                'anthropic-version': '2023-06-01',
+            }
+            data = {
+                'model': self.model_name or 'claude-3-sonnet-20240229',
+                'max_tokens': self.max_tokens,
+                'temperature': self.temperature,
+                'messages': [{'role': 'user', 'content': prompt}],
+                'stream': True,
+            }
+            return self.api_url, headers, data, self._extract_claude_stream_text
+        if self.provider_type == 'gemini':
+            url = self.api_url.replace(':generateContent', ':streamGenerateContent')
+            data = {
+                'contents': [{'parts': [{'text': prompt}]}],
+                'generationConfig': {'maxOutputTokens': self.max_tokens, 'temperature': self.temperature},
+            }
+            return (f"{url}?alt=sse&key={self.api_key}", {'Content-Type': 'application/json'}, data,
+                    self._extract_gemini_stream_text)
+        return None
+
+    @staticmethod
+    def _extract_openai_stream_text(event):
+        choices = event.get('choices') or [{}]
+        return (choices[0].get('delta') or {}).get('content')
+
+    @staticmethod
+    def _extract_claude_stream_text(event):
+        if event.get('type') == 'error':
+            raise UserError(f"AI API调用失败: {event.get('error', {}).get('message', event)}")
+        if event.get('type') == 'content_block_delta':
+            return event.get('delta', {}).get('text')
+        return None
+
+    @staticmethod
+    def _extract_gemini_stream_text(event):
+        candidates = event.get('candidates') or [{}]
+        parts = candidates[0].get('content', {}).get('parts', [])
+        return ''.join(part.get('text', '') for part in parts)
+
+    def _record_throttling(self, error):
+        """Tell the rate limiter about a 429 response"""
+        if error.response is not None and error.response.status_code == 429:
+            self.env['learning.ai.rate.limit'].sudo()._record_result(
+                self, throttled=True, retry_after=self._parse_retry_after(error.response.headers.get('Retry-After')))
+
+    def _call_ai_api_hedged(self, prompt, backup, errors, usage):
+        """Call this configuration, and ``backup`` too if it has not answered after ``hedge_delay`` seconds
+
+        Both calls run in threads with their own cursors and the first
+        answer wins; the slower call is left to finish in its thread and
+        its result is dropped.
+
+        :return: ``(response, configuration that answered)``, or None when
+            both failed (their errors are appended to ``errors``)
+        """
+        call_args = (self.env.cr.dbname, self.env.uid, dict(self.env.context))
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='learning_ai_hedge')
         try:
-            if self.provider_type == 'openai':
-                return self._call_openai_api(prompt)
-            elif self.provider_type == 'gemini':
-                return self._call_gemini_api(prompt)
-            elif self.provider_type == 'deepseek':
-                return self._call_deepseek_api(prompt)
-            elif self.provider_type == 'claude':
-                return self._call_claude_api(prompt)
+            primary = executor.submit(call_ai_attempt_in_thread, *call_args, self.id, prompt)
+            futures = {primary: self}
+            wait([primary], timeout=self.hedge_delay)
+            if primary.done() and primary.exception() is None:
+                response, usage_data = primary.result()
+                usage.update(usage_data)
+                return response, self
+            if not primary.done():
+                _logger.info(f"AI服务 {self.provider_name} {self.hedge_delay}秒内未响应，同时请求 {backup.provider_name}")
+            futures[executor.submit(call_ai_attempt_in_thread, *call_args, backup.id, prompt)] = backup
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    config = futures[future]
+                    if future.exception() is None:
+                        response, usage_data = future.result()
+                        usage.update(usage_data)
+                        return response, config
+                    errors.append((config, future.exception()))
+                    _logger.error(f"AI API调用失败 ({config.provider_name}): {str(future.exception())}")
+            return None
+        finally:
+            executor.shutdown(wait=False)
+
+    def _call_ai_api_with_retry(self, prompt, usage=None):
+        """Call this provider, retrying transient failures with exponential backoff"""
+        self.ensure_one()
+        attempt = 1
+        while True:
+            try:
+                return self._call_ai_api_once(prompt, usage)
+            except Exception as e:
+                if attempt >= max(self.retry_max_attempts, 1) or not self._is_retryable_error(e):
+                    raise
+                delay = self._get_retry_delay(attempt, e)
+                _logger.warning(f"AI服务 {self.provider_name} 第 {attempt} 次请求失败，"
+                                f"{delay:.1f}秒后重试: {str(e)}")
+                time.sleep(delay)
+                attempt += 1
+
+    def _is_retryable_error(self, error):
+        """Connection errors and timeouts are always retried, HTTP errors when their status is retryable"""
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            status = error.response.status_code
+            return any(status == code or status // 100 == code_class
+                       for code, code_class in self._parse_retry_statuses(self.retry_statuses))
+        return False
+
+    @staticmethod
+    def _parse_retry_statuses(value):
+        """Parse ``429,502,5xx`` into ``(status, None)`` and ``(None, status class)`` pairs"""
+        statuses = []
+        for token in (value or '').replace(' ', '').split(','):
+            if not token:
+                continue
+            if len(token) == 3 and token[0].isdigit() and token[1:].lower() == 'xx':
+                statuses.append((None, int(token[0])))
+            elif token.isdigit():
+                statuses.append((int(token), None))
             else:
-                return self._call_custom_api(prompt)
-        except Exception as e:
-            _logger.error(f"AI API调用失败: {str(e)}")
-            raise UserError(f"AI API调用失败: {str(e)}")
+                raise ValueError(token)
+        return statuses
+
+    def _get_retry_delay(self, attempt, error):
+        """Exponential backoff of ``attempt``, with full jitter, and at least the Retry-After of a 429"""
+        delay = min(self.retry_backoff_max, self.retry_backoff * 2 ** (attempt - 1))
+        if self.retry_jitter:
+            delay = random.uniform(0, delay)
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            retry_after = self._parse_retry_after(error.response.headers.get('Retry-After'))
+            if retry_after:
+                delay = max(delay, min(retry_after, self.retry_backoff_max))
+        return max(delay, 0)
+
+    def _describe_ai_error(self, error):
+        """Return the message shown to users for ``error``"""
+        if isinstance(error, UserError):
+            return error.args[0]
+        if (isinstance(error, requests.HTTPError) and error.response is not None
+                and error.response.status_code == 429):
+            return f"AI服务 {self.provider_name} 请求过于频繁，已自动降低并发，请稍后重试"
+        return f"AI API调用失败: {str(error)}"
+
+    def _call_ai_api_once(self, prompt, usage=None):
+        """Call AI API with given prompt once, within the rate limits of the configuration"""
+        RateLimit = self.env['learning.ai.rate.limit'].sudo()
+        try:
+            with RateLimit._reserve(self, self._estimate_request_tokens(prompt)):
+                if self.provider_type == 'openai':
+                    response = self._call_openai_api(prompt, usage)
+                elif self.provider_type == 'gemini':
+                    response = self._call_gemini_api(prompt, usage)
+                elif self.provider_type == 'deepseek':
+                    response = self._call_deepseek_api(prompt, usage)
+                elif self.provider_type == 'claude':
+                    response = self._call_claude_api(prompt, usage)
+                else:
+                    response = self._call_custom_api(prompt, usage)
+        except requests.HTTPError as e:
+            self._record_throttling(e)
+            raise
+        RateLimit._record_result(self)
+        return response
+
+    def _estimate_request_tokens(self, prompt):
+        """Tokens counted against the tokens-per-minute budget: prompt tokens plus the completion limit"""
+        return count_tokens(prompt, self.model_name) + (self.max_tokens or 0)
+
+    @staticmethod
+    def _parse_usage(result):
+        """Return the token usage reported in a provider response (or stream event), or None
+
+        :return: dict with ``input_tokens`` (cached ones included),
+            ``output_tokens`` and ``cached_tokens``
+        """
+        if not isinstance(result, dict):
+            return None
+        metadata = result.get('usageMetadata')
+        if metadata:
+            # Gemini
+            return {
+                'input_tokens': metadata.get('promptTokenCount') or 0,
+                'output_tokens': metadata.get('candidatesTokenCount') or 0,
+                'cached_tokens': metadata.get('cachedContentTokenCount') or 0,
+            }
+        usage = result.get('usage')
+        if not isinstance(usage, dict):
+            return None
+        if 'prompt_tokens' in usage:
+            # OpenAI, DeepSeek and compatible APIs
+            cached_tokens = ((usage.get('prompt_tokens_details') or {}).get('cached_tokens')
+                             or usage.get('prompt_cache_hit_tokens') or 0)
+            return {
+                'input_tokens': usage.get('prompt_tokens') or 0,
+                'output_tokens': usage.get('completion_tokens') or 0,
+                'cached_tokens': cached_tokens,
+            }
+        if 'input_tokens' in usage or 'output_tokens' in usage:
+            # Claude: input_tokens excludes the tokens read from or written to the prompt cache
+            cached_tokens = usage.get('cache_read_input_tokens') or 0
+            return {
+                'input_tokens': ((usage.get('input_tokens') or 0) + cached_tokens
+                                 + (usage.get('cache_creation_input_tokens') or 0)),
+                'output_tokens': usage.get('output_tokens') or 0,
+                'cached_tokens': cached_tokens,
+            }
+        return None
+
+    def _update_usage(self, usage, result):
+        """Merge the usage reported in ``result`` into the ``usage`` dict
+
+        Streamed events report cumulative counts, so the highest count wins.
+        """
+        reported = self._parse_usage(result)
+        if usage is None or not reported:
+            return
+        for key, value in reported.items():
+            usage[key] = max(usage.get(key) or 0, value)
+        usage['source'] = 'provider'
+
+    def _complete_usage(self, usage, prompt, response):
+        """Count the tokens locally when the provider reported no usage, and record which config answered"""
+        if usage.get('source') != 'provider':
+            usage.update(
+                input_tokens=count_tokens(prompt, self.model_name),
+                output_tokens=count_tokens(response, self.model_name),
+                cached_tokens=0,
+                source='estimate',
+            )
+        usage['config_id'] = self.id
+
+    def _get_usage_cost(self, usage):
+        """Return the cost of ``usage`` at the price of the model of the configuration that answered"""
+        config = self.browse(usage.get('config_id')) if usage.get('config_id') else self
+        if not usage or not config:
+            return 0.0
+        price = self.env['learning.ai.price'].sudo()._find(config.provider_type, config.model_name)
+        return price._compute_cost(usage) if price else 0.0
+
+    @staticmethod
+    def _format_usage(usage):
+        """Return a log line describing ``usage``"""
+        source = {'provider': 'API返回', 'estimate': '本地估算', 'cache': '缓存命中'}.get(usage.get('source'), '未知')
+        return (f"Token使用: {usage.get('input_tokens', 0) + usage.get('output_tokens', 0)} "
+                f"(输入: {usage.get('input_tokens', 0)}, 其中缓存: {usage.get('cached_tokens', 0)}, "
+                f"输出: {usage.get('output_tokens', 0)}, 来源: {source})")
+
+    @staticmethod
+    def _parse_retry_after(value):
+        """Return the seconds of a Retry-After header given in seconds, or None"""
+        try:
+            return max(float(value), 0)
+        except (TypeError, ValueError):
+            return None
+
+    def _call_ai_api_parallel(self, prompts):
+        """Call the AI API with several independent prompts at once
+
+        Each call runs in its own thread with its own cursor, since ORM
+        records and cursors must not be shared between threads. The caller's
+        cursor is not used, so the database work on the responses stays on it.
+
+        :return: list of ``(response, response time in seconds, token usage)``, in the order of ``prompts``
+        """
+        self.ensure_one()
+        call_args = (self.env.cr.dbname, self.env.uid, dict(self.env.context), self.id)
+        with ThreadPoolExecutor(max_workers=len(prompts), thread_name_prefix='learning_ai') as executor:
+            futures = [executor.submit(call_ai_api_in_thread, *call_args, prompt) for prompt in prompts]
+            return [future.result() for future in futures]
 
-    def _call_openai_api(self, prompt):
+    def _call_openai_api(self, prompt, usage=None):
         """Call OpenAI API"""
         headers = {
             'Authorization': f'Bearer {self.api_key}',
@@ -122,7 +690,7 @@ class AIConfig(models.Model):
             'temperature': self.temperature
         }
         
-        response = requests.post(
+        response = http_pool.post(
             self.api_url,
             headers=headers,
             json=data,
@@ -131,9 +699,10 @@ class AIConfig(models.Model):
         response.raise_for_status()
         
         result = response.json()
+        self._update_usage(usage, result)
         return result['choices'][0]['message']['content']
 
-    def _call_gemini_api(self, prompt):
+    def _call_gemini_api(self, prompt, usage=None):
         """Call Google Gemini API"""
         headers = {
             'Content-Type': 'application/json'
@@ -151,13 +720,14 @@ class AIConfig(models.Model):
             }
         }
         
-        response = requests.post(url, headers=headers, json=data, timeout=self.timeout)
+        response = http_pool.post(url, headers=headers, json=data, timeout=self.timeout)
         response.raise_for_status()
         
         result = response.json()
+        self._update_usage(usage, result)
         return result['candidates'][0]['content']['parts'][0]['text']
 
-    def _call_deepseek_api(self, prompt):
+    def _call_deepseek_api(self, prompt, usage=None):
         """Call DeepSeek API"""
         headers = {
             'Authorization': f'Bearer {self.api_key}',
@@ -173,7 +743,7 @@ class AIConfig(models.Model):
             'temperature': self.temperature
         }
         
-        response = requests.post(
+        response = http_pool.post(
             self.api_url,
             headers=headers,
             json=data,
@@ -182,9 +752,10 @@ class AIConfig(models.Model):
         response.raise_for_status()
         
         result = response.json()
+        self._update_usage(usage, result)
         return result['choices'][0]['message']['content']
 
-    def _call_claude_api(self, prompt):
+    def _call_claude_api(self, prompt, usage=None):
         """Call Anthropic Claude API"""
         headers = {
             'x-api-key': self.api_key,
@@ -201,7 +772,7 @@ class AIConfig(models.Model):
             ]
         }
         
-        response = requests.post(
+        response = http_pool.post(
             self.api_url,
             headers=headers,
             json=data,
@@ -210,9 +781,10 @@ class AIConfig(models.Model):
         response.raise_for_status()
         
         result = response.json()
+        self._update_usage(usage, result)
         return result['content'][0]['text']
 
-    def _call_custom_api(self, prompt):
+    def _call_custom_api(self, prompt, usage=None):
         """Call custom API"""
         headers = {
             'Authorization': f'Bearer {self.api_key}',
@@ -225,7 +797,7 @@ class AIConfig(models.Model):
             'temperature': self.temperature
         }
         
-        response = requests.post(
+        response = http_pool.post(
             self.api_url,
             headers=headers,
             json=data,
@@ -234,6 +806,7 @@ class AIConfig(models.Model):
         response.raise_for_status()
         
         result = response.json()
+        self._update_usage(usage, result)
         # 假设自定义API返回格式为 {'response': 'content'}
         return result.get('response', result.get('content', str(result)))
 
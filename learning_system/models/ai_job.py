@@ -0,0 +1,440 @@
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+from .ai_config import call_ai_api_in_thread
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import timedelta
+import json
+import logging
+import psycopg2
+import queue
+
+_logger = logging.getLogger(__name__)
+
+# A running job not finished after this delay is considered lost (server restarted)
+AI_JOB_TIMEOUT = timedelta(minutes=15)
+# Jobs processed by one cron run before it re-triggers itself
+AI_JOB_BATCH = 50
+# Attempts of a job before it is marked as failed, and delay before the first retry
+AI_JOB_MAX_ATTEMPTS = 3
+AI_JOB_RETRY_DELAY = timedelta(minutes=2)
+# Both prompts of the batch generation mode, requested concurrently
+AI_JOB_BATCH_TYPES = ('vocabulary', 'sentences')
+AI_JOB_BATCH_LABELS = {'vocabulary': '词汇', 'sentences': '句子', 'complete': '项'}
+# Seconds between two progress notifications while responses are streamed
+AI_JOB_PROGRESS_INTERVAL = 2
+# Streamed items imported between two commits
+AI_JOB_STREAM_CHECKPOINT_ITEMS = 5
+
+
+class LearningAIJob(models.Model):
+    """Background AI generation of the vocabulary and sentences of a learning set
+
+    Jobs are persistent: a server restart only delays them, the cron picks
+    up pending jobs and requeues the running ones it lost. The user who
+    queued a job from the AI generator wizard gets its progress through the
+    bus (``learning_system/ai_job`` notifications).
+
+    When the AI config streams responses, the vocabulary and sentences of
+    the batch mode are imported as they arrive and linked to the job; a
+    failed or lost run removes them before the job is retried.
+    """
+    _name = 'learning.ai.job'
+    _description = 'Learning AI Generation Job'
+    _order = 'id desc'
+
+    learning_set_id = fields.Many2one('learning.set', string='Learning Set', required=True,
+                                      ondelete='cascade', index=True)
+    collection_id = fields.Many2one(related='learning_set_id.collection_id', store=True, string='Collection')
+    ai_config_id = fields.Many2one('learning.ai.config', string='AI Provider', required=True, ondelete='cascade')
+    generate_mode = fields.Selection([
+        ('batch', 'Vocabulary and Sentences'),
+        ('complete', 'Complete Data'),
+    ], string='Generation Mode', default='batch', required=True,
+        help="分批：词汇和句子两个请求同时生成；完整：一个请求生成整个学习集")
+    user_id = fields.Many2one('res.users', string='Requested By', help="通过消息推送接收进度的用户")
+    progress_message = fields.Char('Progress')
+    state = fields.Selection([
+        ('pending', '等待中'),
+        ('running', '生成中'),
+        ('done', '已完成'),
+        ('failed', '失败'),
+    ], string='Status', default='pending', required=True, index=True)
+    error_message = fields.Text('Error Message')
+    attempt_count = fields.Integer('Attempts', default=0)
+    next_attempt = fields.Datetime('Next Attempt', help="Retry not before this time")
+    date_started = fields.Datetime('Started At')
+    date_done = fields.Datetime('Finished At')
+    vocabulary_count = fields.Integer('Generated Vocabulary')
+    sentence_count = fields.Integer('Generated Sentences')
+    vocabulary_ids = fields.Many2many('learning.vocabulary', string='Imported Vocabulary', readonly=True)
+    sentence_ids = fields.Many2many('learning.sentence', string='Imported Sentences', readonly=True)
+    api_response_time = fields.Float('Response Time (seconds)')
+    tokens_used = fields.Integer('Tokens Used')
+    api_cost_estimate = fields.Float('Estimated Cost', digits=(16, 6))
+
+    def init(self):
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS learning_ai_job_active_set_uniq
+            ON learning_ai_job (learning_set_id)
+            WHERE state IN ('pending', 'running')
+        """)
+
+    @api.model
+    def _enqueue(self, learning_sets, ai_config):
+        """Queue the AI generation of ``learning_sets`` that have a text and no content yet
+
+        :return: number of queued jobs
+        """
+        learning_sets = learning_sets.filtered(
+            lambda s: s.full_text and not s.vocabulary_count and not s.sentence_count)
+        queued = self.sudo().search([
+            ('learning_set_id', 'in', learning_sets.ids),
+            ('state', 'in', ('pending', 'running')),
+        ]).learning_set_id
+        count = 0
+        for learning_set in learning_sets - queued:
+            try:
+                with self.env.cr.savepoint():
+                    self.sudo().create({'learning_set_id': learning_set.id, 'ai_config_id': ai_config.id})
+                    count += 1
+            except psycopg2.IntegrityError:
+                # Queued concurrently by someone else
+                continue
+        if count:
+            self.env.ref('learning_system.ir_cron_learning_ai_job')._trigger()
+        _logger.info(f"已为 {count} 个学习集创建AI生成任务 (AI提供商: {ai_config.provider_name})")
+        return count
+
+    @api.model
+    def _enqueue_generation(self, learning_set, ai_config, generate_mode='batch'):
+        """Queue the generation of ``learning_set`` requested from the AI generator wizard
+
+        Unlike ``_enqueue``, the set may already have content. The
+        requesting user is notified of the progress.
+        """
+        try:
+            with self.env.cr.savepoint():
+                job = self.sudo().create({
+                    'learning_set_id': learning_set.id,
+                    'ai_config_id': ai_config.id,
+                    'generate_mode': generate_mode,
+                    'user_id': self.env.uid,
+                    'progress_message': '等待生成',
+                })
+        except psycopg2.IntegrityError:
+            raise UserError(f"学习集 {learning_set.name} 已有进行中的AI生成任务")
+        self.env.ref('learning_system.ir_cron_learning_ai_job')._trigger()
+        _logger.info(f"已为学习集 {learning_set.name} 创建AI生成任务 (AI提供商: {ai_config.provider_name})")
+        return job
+
+    @api.model
+    def _process_jobs(self, limit=AI_JOB_BATCH):
+        """Cron: generate the content of pending jobs
+
+        At most ``max_concurrency`` sets per AI configuration are generated
+        at once. The API calls run in worker threads with their own cursors;
+        prompts are built and results imported on this cursor. Streamed
+        items of the batch mode are imported as they arrive, committed every
+        ``AI_JOB_STREAM_CHECKPOINT_ITEMS`` items; the rest of a set is
+        imported and committed with its last response.
+        """
+        cr = self.env.cr
+        cr.execute("""
+            UPDATE learning_ai_job SET state = 'pending', date_started = NULL
+            WHERE state = 'running' AND date_started < (now() AT TIME ZONE 'UTC') - %s
+        """, [AI_JOB_TIMEOUT])
+        if cr.rowcount:
+            _logger.warning(f"{cr.rowcount} 个超时的AI生成任务已重新排队")
+        cr.commit()
+
+        configs = self.env['learning.ai.config'].search([])
+        max_workers = max(1, sum(max(1, config.max_concurrency) for config in configs) * len(AI_JOB_BATCH_TYPES))
+        call_args = (cr.dbname, self.env.uid, dict(self.env.context))
+
+        started = 0
+        in_flight = {}  # future: (job, generator, batch_type)
+        expected = {}  # job: number of prompts
+        responses = {}  # job: {batch_type: (response, response time, token usage)}
+        streamed = queue.Queue()  # (job, generator, batch_type, job responses, item) of each streamed item
+        item_counts = {}  # job: {batch_type: number of streamed items}
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='learning_ai_job') as executor:
+            while True:
+                if started < limit:
+                    for job in self._claim(limit - started):
+                        started += 1
+                        try:
+                            job._remove_partial_import()
+                            generator = job._get_generator()
+                            prompts = job._build_prompts(generator)
+                        except Exception as e:
+                            job._mark_failed(e)
+                            continue
+                        job._notify_progress('正在生成...')
+                        # Keep the generator wizard if another job rolls back
+                        cr.commit()
+                        responses[job] = {}
+                        expected[job] = len(prompts)
+                        item_counts[job] = {}
+                        for batch_type, prompt in prompts.items():
+                            def on_item(item, key=(job, generator, batch_type, responses[job])):
+                                streamed.put(key + (item,))
+                            future = executor.submit(
+                                call_ai_api_in_thread, *call_args, job.ai_config_id.id, prompt, on_item)
+                            in_flight[future] = (job, generator, batch_type)
+                if not in_flight:
+                    break
+
+                done, _pending = wait(in_flight, timeout=AI_JOB_PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+                self._import_streamed_items(streamed, item_counts, responses)
+                for future in done:
+                    job, generator, batch_type = in_flight.pop(future)
+                    if job not in responses:
+                        continue  # the other call of the job already failed
+                    try:
+                        responses[job][batch_type] = future.result()
+                    except Exception as e:
+                        del responses[job]
+                        job._mark_failed(e)
+                        continue
+                    if len(responses[job]) == expected[job]:
+                        job._import(generator, responses.pop(job), item_counts.pop(job))
+                    else:
+                        job._notify_progress(f"{AI_JOB_BATCH_LABELS[batch_type]}已生成，等待其余部分...")
+                        cr.commit()
+                if done:
+                    _logger.info("AI生成进度: %s", self._get_progress())
+
+        # More jobs may be waiting (or scheduled for a retry): run again for them
+        cron = self.env.ref('learning_system.ir_cron_learning_ai_job')
+        if self.search_count([('state', '=', 'pending'), ('next_attempt', '=', False)]):
+            cron._trigger()
+        else:
+            retry_job = self.search([('state', '=', 'pending')], order='next_attempt', limit=1)
+            if retry_job:
+                cron._trigger(retry_job.next_attempt)
+
+    @api.model
+    def _claim(self, count):
+        """Lock due pending jobs within the free concurrency slots of their AI config, mark them running
+
+        Only one instance of the cron runs at a time, so counting the running
+        jobs is enough to respect ``max_concurrency``, further reduced while
+        the provider's adaptive concurrency is lowered by 429 responses.
+        """
+        cr = self.env.cr
+        cr.execute("""
+            SELECT ai_config_id, count(*) FROM learning_ai_job
+            WHERE state = 'running'
+            GROUP BY ai_config_id
+        """)
+        running = dict(cr.fetchall())
+
+        jobs = self.browse()
+        RateLimit = self.env['learning.ai.rate.limit'].sudo()
+        for config in self.env['learning.ai.config'].search([]):
+            max_sets = max(1, config.max_concurrency)
+            if config.max_parallel_requests > 0:
+                # Follow the adaptive concurrency of the provider: fewer sets at once after 429s
+                parallel = min(RateLimit._get_state(config)['concurrency'], config.max_parallel_requests)
+                max_sets = min(max_sets, max(1, int(parallel) // len(AI_JOB_BATCH_TYPES)))
+            slots = min(max_sets - running.get(config.id, 0), count - len(jobs))
+            if slots <= 0:
+                continue
+            cr.execute("""
+                SELECT id FROM learning_ai_job
+                WHERE state = 'pending' AND ai_config_id = %s
+                  AND (next_attempt IS NULL OR next_attempt <= now() AT TIME ZONE 'UTC')
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, [config.id, slots])
+            jobs |= self.browse([row[0] for row in cr.fetchall()])
+
+        for job in jobs:
+            job.write({
+                'state': 'running',
+                'date_started': fields.Datetime.now(),
+                'attempt_count': job.attempt_count + 1,
+            })
+        cr.commit()
+        return jobs
+
+    @api.model
+    def _import_streamed_items(self, streamed, item_counts, responses):
+        """Import the items streamed since the last call and notify the progress of their jobs
+
+        Vocabulary and sentences are imported one by one and committed every
+        ``AI_JOB_STREAM_CHECKPOINT_ITEMS`` items; items of the complete mode
+        (parts of one JSON object) are only counted.
+        """
+        updated = []
+        uncommitted = 0
+        while not streamed.empty():
+            job, generator, batch_type, job_responses, item = streamed.get_nowait()
+            if responses.get(job) is not job_responses:
+                continue  # the run of the job already failed
+            counts = item_counts[job]
+            counts[batch_type] = counts.get(batch_type, 0) + 1
+            if job not in updated:
+                updated.append(job)
+            if batch_type in AI_JOB_BATCH_TYPES:
+                job._import_streamed_item(generator, batch_type, item)
+                uncommitted += 1
+                if uncommitted >= AI_JOB_STREAM_CHECKPOINT_ITEMS:
+                    self.env.cr.commit()
+                    uncommitted = 0
+        if not updated:
+            return
+        for job in updated:
+            job._notify_progress("正在生成...已生成" + "，".join(
+                f"{AI_JOB_BATCH_LABELS[batch_type]} {count} 个"
+                for batch_type, count in item_counts[job].items()))
+        self.env.cr.commit()
+
+    def _import_streamed_item(self, generator, batch_type, item):
+        """Import one streamed vocabulary or sentence ``item`` under a savepoint and link it to the job
+
+        An item that cannot be imported is logged and skipped.
+        """
+        self.ensure_one()
+        try:
+            with self.env.cr.savepoint():
+                if batch_type == 'vocabulary':
+                    self.vocabulary_ids |= generator._import_vocabulary_data([item])
+                else:
+                    self.sentence_ids |= generator._import_sentences_data([item])
+        except Exception as e:
+            _logger.warning(f"AI生成任务 {self.id}: {AI_JOB_BATCH_LABELS[batch_type]}导入失败，已跳过: {str(e)}")
+            return
+        self.write({'vocabulary_count': len(self.vocabulary_ids), 'sentence_count': len(self.sentence_ids)})
+
+    def _remove_partial_import(self):
+        """Delete the streamed items that a failed or lost run of the job committed"""
+        self.ensure_one()
+        if not self.vocabulary_ids and not self.sentence_ids:
+            return
+        _logger.info(f"AI生成任务 {self.id}: 删除上次运行已导入的词汇 {len(self.vocabulary_ids)} 个、"
+                     f"句子 {len(self.sentence_ids)} 个")
+        self.vocabulary_ids.unlink()
+        self.sentence_ids.unlink()
+        self.write({'vocabulary_count': 0, 'sentence_count': 0})
+
+    def _notify_progress(self, message):
+        """Record the progress of the job and push it to the user who queued it (sent on commit)"""
+        self.ensure_one()
+        self.progress_message = message
+        if self.user_id:
+            self.env['bus.bus'].sudo()._sendone(self.user_id.partner_id, 'learning_system/ai_job', {
+                'id': self.id,
+                'learning_set_id': self.learning_set_id.id,
+                'learning_set_name': self.learning_set_id.name,
+                'state': self.state,
+                'message': message,
+            })
+
+    def _get_generator(self):
+        """Return an AI generator wizard of the job's learning set, to build prompts and import"""
+        self.ensure_one()
+        return self.env['learning.ai.generator'].create({
+            'learning_set_id': self.learning_set_id.id,
+            'ai_config_id': self.ai_config_id.id,
+            'generate_mode': 'batch' if self.generate_mode == 'batch' else 'replace',
+            'status': 'generating',
+            'api_call_time': fields.Datetime.now(),
+            'ai_model_used': f"{self.ai_config_id.provider_name} - {self.ai_config_id.model_name}",
+        })
+
+    def _build_prompts(self, generator):
+        """Return the prompts of the job: ``{batch type: prompt}``"""
+        self.ensure_one()
+        if self.generate_mode == 'batch':
+            return {batch_type: generator._build_batch_prompt(batch_type) for batch_type in AI_JOB_BATCH_TYPES}
+        return {'complete': generator._build_prompt()}
+
+    def _import(self, generator, responses, item_counts):
+        """Parse the responses of the job, import what was not imported while streaming, and commit
+
+        :param item_counts: ``{batch_type: number of streamed items}``, already imported
+        """
+        self.ensure_one()
+        try:
+            if self.generate_mode == 'batch':
+                vocab_data = generator._parse_batch_response(responses['vocabulary'][0], 'vocabulary')
+                sentences_data = generator._parse_batch_response(responses['sentences'][0], 'sentences')
+                self.vocabulary_ids |= generator._import_vocabulary_data(
+                    vocab_data[item_counts.get('vocabulary', 0):])
+                self.sentence_ids |= generator._import_sentences_data(
+                    sentences_data[item_counts.get('sentences', 0):])
+                generated_data = {
+                    self.learning_set_id.name: {
+                        "fullText": self.learning_set_id.full_text,
+                        "description": f"{self.learning_set_id.name} - 分批生成",
+                        "vocabulary": vocab_data,
+                        "sentences": sentences_data,
+                    }
+                }
+            else:
+                generated_data = generator._parse_ai_response(responses['complete'][0])
+                vocabularies, sentences = generator._import_generated_data(generated_data)
+                self.vocabulary_ids |= vocabularies
+                self.sentence_ids |= sentences
+
+            usages = [usage for _response, _response_time, usage in responses.values()]
+            generator._record_usage(usages)
+            generator.write({
+                'status': 'success',
+                'progress_message': '学习数据生成完成！',
+                'api_response_time': max(response_time for _response, response_time, _usage in responses.values()),
+                'generated_data': json.dumps(generated_data, ensure_ascii=False, indent=2),
+            })
+            self.write({
+                'state': 'done',
+                'date_done': fields.Datetime.now(),
+                'error_message': False,
+                'vocabulary_count': len(self.vocabulary_ids),
+                'sentence_count': len(self.sentence_ids),
+                'api_response_time': generator.api_response_time,
+                'tokens_used': generator.tokens_used,
+                'api_cost_estimate': generator.api_cost_estimate,
+            })
+            self._notify_progress(f"生成完成：词汇 {self.vocabulary_count} 个，句子 {self.sentence_count} 个")
+            self.env.cr.commit()
+            _logger.info(f"学习集 {self.learning_set_id.name} AI生成完成: "
+                         f"词汇 {self.vocabulary_count} 个, 句子 {self.sentence_count} 个")
+        except Exception as e:
+            self._mark_failed(e)
+
+    def _mark_failed(self, error):
+        """Roll back the job's changes and remove its committed streamed items, then schedule a retry or give up"""
+        self.env.cr.rollback()
+        self._remove_partial_import()
+        _logger.error(f"学习集 {self.learning_set_id.id} AI生成任务 {self.id} 失败 "
+                      f"(第 {self.attempt_count} 次): {str(error)}")
+        if self.attempt_count < AI_JOB_MAX_ATTEMPTS:
+            delay = AI_JOB_RETRY_DELAY * 2 ** (self.attempt_count - 1)
+            self.write({
+                'state': 'pending',
+                'next_attempt': fields.Datetime.now() + delay,
+                'error_message': str(error),
+            })
+            self._notify_progress(f"生成失败，{int(delay.total_seconds() // 60)} 分钟后重试：{str(error)}")
+        else:
+            self.write({'state': 'failed', 'date_done': fields.Datetime.now(), 'error_message': str(error)})
+            self._notify_progress(f"生成失败：{str(error)}")
+        self.env.cr.commit()
+
+    @api.model
+    def _get_progress(self, domain=None):
+        """Return the number of jobs per state"""
+        groups = self.read_group(domain or [], ['state'], ['state'])
+        return {group['state']: group['state_count'] for group in groups}
+
+    def action_retry(self):
+        """Queue failed jobs again (UI action)"""
+        self.filtered(lambda job: job.state == 'failed').write({
+            'state': 'pending',
+            'attempt_count': 0,
+            'next_attempt': False,
+            'error_message': False,
+        })
+        self.env.ref('learning_system.ir_cron_learning_ai_job')._trigger()
@@ -0,0 +1,49 @@
+from odoo import models, fields, api
+
+
+class LearningAIPrice(models.Model):
+    """Token prices of an AI model, used to compute the cost of the calls
+
+    A configuration uses the price of its provider type whose model name is
+    the longest prefix of its own (``gpt-4-turbo`` prices
+    ``gpt-4-turbo-2024-04-09``).
+    """
+    _name = 'learning.ai.price'
+    _description = 'AI Model Price'
+    _order = 'provider_type, model_name'
+
+    provider_type = fields.Selection([
+        ('openai', 'OpenAI (ChatGPT)'),
+        ('gemini', 'Google Gemini'),
+        ('deepseek', 'DeepSeek'),
+        ('claude', 'Anthropic Claude'),
+        ('custom', 'Custom API')
+    ], string='Provider Type', required=True)
+    model_name = fields.Char('Model Name', required=True, help="模型名称或其前缀")
+    input_price = fields.Float('Input Price', digits=(16, 4), help="每百万输入token的价格（美元）")
+    output_price = fields.Float('Output Price', digits=(16, 4), help="每百万输出token的价格（美元）")
+    cached_input_price = fields.Float('Cached Input Price', digits=(16, 4),
+                                      help="每百万缓存命中输入token的价格（美元），0表示按输入价格计")
+    active = fields.Boolean('Active', default=True)
+
+    _sql_constraints = [
+        ('model_uniq', 'unique(provider_type, model_name)', 'A model can only have one price'),
+    ]
+
+    @api.model
+    def _find(self, provider_type, model_name):
+        """Return the price of ``model_name``, or an empty recordset"""
+        prices = self.search([('provider_type', '=', provider_type)])
+        prices = prices.filtered(lambda price: (model_name or '').startswith(price.model_name))
+        return prices.sorted(lambda price: len(price.model_name), reverse=True)[:1]
+
+    def _compute_cost(self, usage):
+        """Return the cost of ``usage`` (``input_tokens``, ``output_tokens``, ``cached_tokens``)"""
+        self.ensure_one()
+        cached_tokens = usage.get('cached_tokens', 0)
+        cached_price = self.cached_input_price or self.input_price
+        return (
+            (usage.get('input_tokens', 0) - cached_tokens) * self.input_price
+            + cached_tokens * cached_price
+            + usage.get('output_tokens', 0) * self.output_price
+        ) / 1000000
@@ -0,0 +1,188 @@
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+from contextlib import contextmanager
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+# High bits of the advisory lock keys of the concurrency slots, so they do not collide with other locks
+SLOT_LOCK_NAMESPACE = 0x4C53
+# Seconds between two attempts to get a concurrency slot or budget
+RATE_LIMIT_POLL = 0.5
+# Longest sleep between two checks of the budget (seconds), it may be refilled by a config change
+RATE_LIMIT_MAX_SLEEP = 5
+# Cool down after a 429 without Retry-After header (seconds)
+RATE_LIMIT_COOLDOWN = 10
+
+
+def _refill(allowance, limit, elapsed):
+    """Return ``allowance`` refilled for ``elapsed`` seconds at ``limit`` per minute, None if unlimited"""
+    if limit <= 0:
+        return None
+    if allowance is None:
+        return limit
+    # Budget is only taken when available: a negative allowance is drift of a formerly unlimited bucket
+    return min(limit, max(allowance, 0) + elapsed * limit / 60)
+
+
+class LearningAIRateLimit(models.Model):
+    """Shared rate limit state of an AI configuration, for all Odoo workers
+
+    The requests-per-minute and tokens-per-minute budgets are token buckets
+    refilled continuously, updated under a row lock. Concurrent calls are
+    bounded by transaction-level advisory locks (one per slot), released
+    automatically even if the worker dies. The number of slots adapts to
+    the provider: halved on every 429, increased slowly after successes.
+
+    All updates use short transactions on cursors of their own, so a long
+    generation transaction never holds the lock of the shared state.
+    """
+    _name = 'learning.ai.rate.limit'
+    _description = 'AI Provider Rate Limit State'
+
+    ai_config_id = fields.Many2one('learning.ai.config', string='AI Provider', required=True,
+                                   ondelete='cascade', readonly=True)
+    request_allowance = fields.Float('Available Requests', readonly=True)
+    token_allowance = fields.Float('Available Tokens', readonly=True)
+    last_refill = fields.Datetime('Last Refill', readonly=True)
+    concurrency = fields.Float('Current Concurrency', readonly=True)
+    cooldown_until = fields.Datetime('Cool Down Until', readonly=True)
+    throttled_count = fields.Integer('429 Responses', readonly=True)
+
+    _sql_constraints = [
+        ('ai_config_uniq', 'unique(ai_config_id)', 'Only one rate limit state per AI provider'),
+    ]
+
+    @api.model
+    @contextmanager
+    def _reserve(self, config, tokens):
+        """Wait for a concurrency slot and for the request and token budget of ``config``
+
+        Raises a UserError when they are not available within the
+        configured maximum wait. The slot is held until the block exits.
+        """
+        deadline = time.monotonic() + max(config.rate_limit_max_wait, 0)
+        with self.env.registry.cursor() as slot_cr:
+            if config.max_parallel_requests > 0:
+                self._wait(config, deadline, lambda: self._take_slot(slot_cr, config))
+            self._wait(config, deadline, lambda: self._take_budget(config, tokens))
+            try:
+                yield
+            finally:
+                # Ends the transaction, and so releases the advisory lock of the slot
+                slot_cr.rollback()
+
+    @api.model
+    def _wait(self, config, deadline, take):
+        """Call ``take`` until it returns no wait time, or raise once ``deadline`` would pass"""
+        while True:
+            wait = take()
+            if not wait:
+                return
+            if time.monotonic() + wait > deadline:
+                raise UserError(f"AI服务 {config.provider_name} 当前请求过多，已达到速率限制，请稍后重试")
+            time.sleep(min(wait, RATE_LIMIT_MAX_SLEEP))
+
+    @api.model
+    def _take_slot(self, slot_cr, config):
+        """Lock a free concurrency slot in ``slot_cr``'s transaction; return 0, or the time to wait"""
+        concurrency = min(self._get_state(config)['concurrency'], config.max_parallel_requests)
+        for slot in range(max(1, int(concurrency))):
+            key = (SLOT_LOCK_NAMESPACE << 40) | (config.id << 12) | slot
+            slot_cr.execute("SELECT pg_try_advisory_xact_lock(%s)", [key])
+            if slot_cr.fetchone()[0]:
+                return 0
+        return RATE_LIMIT_POLL
+
+    @api.model
+    def _take_budget(self, config, tokens):
+        """Take one request and ``tokens`` tokens from the buckets; return 0, or the time to wait"""
+        rpm, tpm = config.rate_limit_rpm, config.rate_limit_tpm
+        with self.env.registry.cursor() as cr:
+            # Concurrent callers wait for the row lock and then see each other's update
+            cr.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+            self._ensure_state(cr, config)
+            cr.execute("""
+                SELECT request_allowance, token_allowance,
+                       EXTRACT(EPOCH FROM (now() AT TIME ZONE 'UTC') - last_refill),
+                       EXTRACT(EPOCH FROM cooldown_until - (now() AT TIME ZONE 'UTC'))
+                  FROM learning_ai_rate_limit
+                 WHERE ai_config_id = %s
+                   FOR UPDATE
+            """, [config.id])
+            requests_left, tokens_left, elapsed, cooldown = cr.fetchone()
+            if cooldown and cooldown > 0:
+                return cooldown
+
+            elapsed = max(elapsed or 0, 0)
+            # An unlimited bucket is stored as NULL, and starts full when a limit is set
+            requests_left = _refill(requests_left, rpm, elapsed)
+            # A request larger than the whole budget may still run alone
+            tokens = min(tokens, tpm)
+            tokens_left = _refill(tokens_left, tpm, elapsed)
+            wait = 0
+            if requests_left is not None and requests_left < 1:
+                wait = max(wait, (1 - requests_left) * 60 / rpm)
+            if tokens_left is not None and tokens_left < tokens:
+                wait = max(wait, (tokens - tokens_left) * 60 / tpm)
+            if not wait:
+                if requests_left is not None:
+                    requests_left -= 1
+                if tokens_left is not None:
+                    tokens_left -= tokens
+            cr.execute("""
+                UPDATE learning_ai_rate_limit
+                   SET request_allowance = %s, token_allowance = %s, last_refill = now() AT TIME ZONE 'UTC'
+                 WHERE ai_config_id = %s
+            """, [requests_left, tokens_left, config.id])
+            return wait
+
+    @api.model
+    def _record_result(self, config, throttled=False, retry_after=None):
+        """Adapt the concurrency of ``config``: halve it on a 429, increase it slowly otherwise"""
+        with self.env.registry.cursor() as cr:
+            cr.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+            self._ensure_state(cr, config)
+            if throttled:
+                cr.execute("""
+                    UPDATE learning_ai_rate_limit
+                       SET concurrency = GREATEST(1, concurrency / 2),
+                           cooldown_until = (now() AT TIME ZONE 'UTC') + %s * interval '1 second',
+                           throttled_count = throttled_count + 1
+                     WHERE ai_config_id = %s
+                """, [retry_after or RATE_LIMIT_COOLDOWN, config.id])
+                _logger.warning(f"AI服务 {config.provider_name} 返回429，并发已降低")
+            else:
+                cr.execute("""
+                    UPDATE learning_ai_rate_limit
+                       SET concurrency = LEAST(%s, concurrency + 1 / GREATEST(concurrency, 1))
+                     WHERE ai_config_id = %s
+                """, [max(config.max_parallel_requests, 1), config.id])
+
+    @api.model
+    def _ensure_state(self, cr, config):
+        cr.execute("""
+            INSERT INTO learning_ai_rate_limit
+                (ai_config_id, request_allowance, token_allowance, last_refill, concurrency, throttled_count)
+            VALUES (%s, %s, %s, now() AT TIME ZONE 'UTC', %s, 0)
+            ON CONFLICT (ai_config_id) DO NOTHING
+        """, [config.id, config.rate_limit_rpm or None, config.rate_limit_tpm or None,
+              max(config.max_parallel_requests, 1)])
+
+    @api.model
+    def _get_state(self, config):
+        """Return the current state of ``config`` (read on a cursor of its own, so always up to date)"""
+        with self.env.registry.cursor() as cr:
+            self._ensure_state(cr, config)
+            cr.execute("""
+                SELECT concurrency, cooldown_until, throttled_count
+                  FROM learning_ai_rate_limit
+                 WHERE ai_config_id = %s
+            """, [config.id])
+            concurrency, cooldown_until, throttled_count = cr.fetchone()
+        return {
+            'concurrency': concurrency,
+            'cooldown_until': cooldown_until,
+            'throttled_count': throttled_count,
+        }
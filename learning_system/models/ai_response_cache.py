@@ -0,0 +1,88 @@
+from odoo import models, fields, api
+import hashlib
+import json
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+class LearningAIResponseCache(models.Model):
+    """Cached AI completions, keyed by the request parameters and a hash of the prompt
+
+    Opt-in per AI configuration (``cache_enabled``); entries expire after
+    the configuration's TTL and the oldest ones are evicted beyond its
+    maximum number of entries.
+    """
+    _name = 'learning.ai.response.cache'
+    _description = 'AI Response Cache'
+    _order = 'last_used desc'
+
+    key = fields.Char('Key', required=True, index=True, readonly=True)
+    ai_config_id = fields.Many2one('learning.ai.config', string='AI Provider', required=True,
+                                   ondelete='cascade', index=True, readonly=True)
+    response = fields.Text('Response', readonly=True)
+    hit_count = fields.Integer('Hits', default=0, readonly=True)
+    last_used = fields.Datetime('Last Used', default=fields.Datetime.now, index=True, readonly=True)
+
+    _sql_constraints = [
+        ('key_uniq', 'unique(ai_config_id, key)', 'AI response cache key must be unique per provider'),
+    ]
+
+    @api.model
+    def _make_key(self, config, prompt):
+        """Return the cache key of ``prompt`` sent with the generation parameters of ``config``"""
+        payload = json.dumps({
+            'provider': config.provider_type,
+            'url': config.api_url,
+            'model': config.model_name,
+            'temperature': config.temperature,
+            'max_tokens': config.max_tokens,
+            'prompt': hashlib.sha256(prompt.encode('utf-8')).hexdigest(),
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @api.model
+    def _lookup(self, config, key):
+        """Return the cached response of ``key`` if it has not expired, else None"""
+        self.env.cr.execute("""
+            UPDATE learning_ai_response_cache
+               SET hit_count = hit_count + 1, last_used = now() AT TIME ZONE 'UTC'
+             WHERE ai_config_id = %s AND key = %s
+               AND create_date >= (now() AT TIME ZONE 'UTC') - %s * interval '1 hour'
+            RETURNING response
+        """, [config.id, key, config.cache_ttl_hours])
+        row = self.env.cr.fetchone()
+        return row[0] if row else None
+
+    @api.model
+    def _store(self, config, key, response):
+        """Cache ``response``, replacing an expired entry, then enforce the size bound"""
+        cr = self.env.cr
+        cr.execute("""
+            INSERT INTO learning_ai_response_cache
+                (key, ai_config_id, response, hit_count, last_used, create_uid, create_date, write_uid, write_date)
+            VALUES (%s, %s, %s, 0, now() AT TIME ZONE 'UTC', %s, now() AT TIME ZONE 'UTC', %s, now() AT TIME ZONE 'UTC')
+            ON CONFLICT (ai_config_id, key) DO UPDATE
+               SET response = EXCLUDED.response, hit_count = 0,
+                   last_used = EXCLUDED.last_used, create_date = EXCLUDED.create_date
+        """, [key, config.id, response, self.env.uid, self.env.uid])
+        cr.execute("""
+            DELETE FROM learning_ai_response_cache
+             WHERE id IN (
+                SELECT id FROM learning_ai_response_cache
+                 WHERE ai_config_id = %s
+                 ORDER BY last_used DESC
+                OFFSET %s
+             )
+        """, [config.id, max(config.cache_max_entries, 0)])
+
+    @api.model
+    def _gc_cache(self):
+        """Cron: drop expired entries of every AI configuration"""
+        self.env.cr.execute("""
+            DELETE FROM learning_ai_response_cache c
+             USING learning_ai_config config
+             WHERE c.ai_config_id = config.id
+               AND c.create_date < (now() AT TIME ZONE 'UTC') - config.cache_ttl_hours * interval '1 hour'
+        """)
+        _logger.info("Removed %s expired AI response cache entries", self.env.cr.rowcount)
@@ -0,0 +1,254 @@
+from odoo import models, fields, api
+from .tts_client import fetch_tts_segments, TTS_PARAMS
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+import logging
+import psycopg2
+
+_logger = logging.getLogger(__name__)
+
+# A running job not finished after this delay is considered lost (worker killed)
+AUDIO_JOB_TIMEOUT = timedelta(minutes=10)
+# Jobs processed by one cron run before it re-triggers itself
+AUDIO_JOB_BATCH = 50
+# Default number of concurrent TTS requests of a cron run
+AUDIO_JOB_WORKERS = 4
+# Attempts of a job before it is marked as failed, and delay before the first retry
+AUDIO_JOB_MAX_ATTEMPTS = 3
+AUDIO_JOB_RETRY_DELAY = timedelta(minutes=1)
+# Namespace of the advisory locks that serialize the enqueuers of a learning set
+AUDIO_JOB_LOCK_NAMESPACE = int.from_bytes(b'laud', 'big')
+
+
+class LearningAudioJob(models.Model):
+    """Background audio generation of a learning set
+
+    Concurrent requests for the same set share one job: they are
+    serialized by an advisory lock on the set id, and a partial unique
+    index allows only one pending/running job per set.
+    """
+    _name = 'learning.audio.job'
+    _description = 'Learning Audio Generation Job'
+    _order = 'id desc'
+
+    learning_set_id = fields.Many2one('learning.set', string='Learning Set', required=True,
+                                      ondelete='cascade', index=True)
+    state = fields.Selection([
+        ('pending', '等待中'),
+        ('running', '生成中'),
+        ('done', '已完成'),
+        ('failed', '失败'),
+    ], string='Status', default='pending', required=True, index=True)
+    error_message = fields.Text('Error Message')
+    attempt_count = fields.Integer('Attempts', default=0)
+    next_attempt = fields.Datetime('Next Attempt', help="Retry not before this time")
+    date_started = fields.Datetime('Started At')
+    date_done = fields.Datetime('Finished At')
+
+    def init(self):
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS learning_audio_job_active_set_uniq
+            ON learning_audio_job (learning_set_id)
+            WHERE state IN ('pending', 'running')
+        """)
+
+    @api.model
+    def _enqueue(self, learning_set, trigger=True):
+        """Queue the audio generation of ``learning_set`` unless a job is pending/running
+
+        :param trigger: run the processing cron right away
+        :return: status data of the job (see ``_get_status_data``)
+        """
+        return self._enqueue_sets(learning_set, trigger)[learning_set.id]
+
+    @api.model
+    def _enqueue_sets(self, learning_sets, trigger=True):
+        """Queue the audio generation of ``learning_sets``, sharing the pending/running job of a set
+
+        The enqueuers of a set are serialized by a transaction-level
+        advisory lock on its id, taken on the caller's cursor and held until
+        the caller commits the job it created. Jobs committed after the
+        snapshot of the caller's transaction are looked up on a short READ
+        COMMITTED cursor; it only reads, so it never waits for the caller's
+        own locks. Jobs are created on the caller's cursor, so the sets may
+        have been created or written in the same transaction.
+
+        :param trigger: run the processing cron right away if a job was created
+        :return: ``{learning set id: status data of its job}`` (see ``_get_status_data``)
+        """
+        cr = self.env.cr
+        # In id order, so two transactions enqueuing the same sets never deadlock
+        for set_id in sorted(learning_sets.ids):
+            cr.execute("SELECT pg_advisory_xact_lock(%s, %s)", [AUDIO_JOB_LOCK_NAMESPACE, set_id])
+
+        active_domain = [('learning_set_id', 'in', learning_sets.ids), ('state', 'in', ('pending', 'running'))]
+        status_data = {}
+        with self.env.registry.cursor() as read_cr:
+            read_cr.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+            for job in self.env(cr=read_cr)['learning.audio.job'].sudo().search(active_domain):
+                status_data[job.learning_set_id.id] = job._get_status_data()
+
+        jobs = self.sudo()
+        created = 0
+        for learning_set in learning_sets:
+            if learning_set.id in status_data:
+                continue
+            try:
+                with cr.savepoint():
+                    job = jobs.create({'learning_set_id': learning_set.id})
+                created += 1
+                _logger.info(f"学习集 {learning_set.id} 音频生成任务已加入队列: {job.id}")
+            except psycopg2.IntegrityError:
+                # Queued earlier in the caller's own transaction
+                job = jobs.search([('learning_set_id', '=', learning_set.id),
+                                   ('state', 'in', ('pending', 'running'))], limit=1)
+            status_data[learning_set.id] = job._get_status_data()
+
+        if created and trigger:
+            self.env.ref('learning_system.ir_cron_learning_audio_job')._trigger()
+        return status_data
+
+    @api.model
+    def _enqueue_missing(self):
+        """Queue the audio generation of every active learning set with text and without audio
+
+        :return: number of queued jobs
+        """
+        learning_sets = self.env['learning.set'].sudo().search([
+            ('audio_file', '=', False),
+            ('full_text', '!=', False),
+        ])
+        self._enqueue_sets(learning_sets)
+        _logger.info(f"已为 {len(learning_sets)} 个缺少音频的学习集创建生成任务")
+        return len(learning_sets)
+
+    @api.model
+    def _process_jobs(self, limit=AUDIO_JOB_BATCH):
+        """Cron: generate the audio of pending jobs
+
+        Jobs are claimed with ``FOR UPDATE SKIP LOCKED`` so several cron
+        workers never pick the same job. The TTS requests of a batch run in
+        a bounded thread pool; the database work stays on this cursor, with
+        one commit per learning set.
+        """
+        cr = self.env.cr
+        cr.execute("""
+            UPDATE learning_audio_job SET state = 'pending', date_started = NULL
+            WHERE state = 'running' AND date_started < (now() AT TIME ZONE 'UTC') - %s
+        """, [AUDIO_JOB_TIMEOUT])
+        if cr.rowcount:
+            _logger.warning(f"{cr.rowcount} 个超时的音频生成任务已重新排队")
+        cr.commit()
+
+        workers = max(1, int(self.env['ir.config_parameter'].sudo().get_param(
+            'learning_system.audio_job_workers', AUDIO_JOB_WORKERS)))
+        tts_url = self.env['learning.set']._get_tts_api_url()
+
+        processed = 0
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='learning_tts') as executor:
+            while processed < limit:
+                jobs = self._claim(min(workers, limit - processed))
+                if not jobs:
+                    break
+                processed += len(jobs)
+
+                futures = {}
+                for job in jobs:
+                    try:
+                        processed_text = job.learning_set_id._prepare_txt2audio()
+                        if job.learning_set_id._use_cached_txt2audio(processed_text):
+                            job._mark_done()
+                            continue
+                    except Exception as e:
+                        job._mark_failed(e)
+                        continue
+                    future = executor.submit(fetch_tts_segments, tts_url, processed_text, TTS_PARAMS)
+                    futures[future] = (job, processed_text)
+
+                for future in as_completed(futures):
+                    job, processed_text = futures[future]
+                    try:
+                        job.learning_set_id._store_txt2audio(processed_text, future.result())
+                        job._mark_done()
+                    except Exception as e:
+                        job._mark_failed(e)
+
+                _logger.info("音频生成进度: %s", self._get_progress())
+
+        # More jobs may be waiting (or scheduled for a retry): run again for them
+        cron = self.env.ref('learning_system.ir_cron_learning_audio_job')
+        if self.search_count([('state', '=', 'pending'), ('next_attempt', '=', False)]):
+            cron._trigger()
+        else:
+            retry_job = self.search([('state', '=', 'pending')], order='next_attempt', limit=1)
+            if retry_job:
+                cron._trigger(retry_job.next_attempt)
+
+    @api.model
+    def _claim(self, count):
+        """Lock up to ``count`` due pending jobs, mark them running and commit"""
+        cr = self.env.cr
+        cr.execute("""
+            SELECT id FROM learning_audio_job
+            WHERE state = 'pending'
+              AND (next_attempt IS NULL OR next_attempt <= now() AT TIME ZONE 'UTC')
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, [count])
+        jobs = self.browse([row[0] for row in cr.fetchall()])
+        for job in jobs:
+            job.write({
+                'state': 'running',
+                'date_started': fields.Datetime.now(),
+                'attempt_count': job.attempt_count + 1,
+            })
+        cr.commit()
+        return jobs
+
+    def _run(self):
+        """Generate the audio of the job's learning set and commit the result"""
+        self.ensure_one()
+        try:
+            self.learning_set_id.generate_txt2audio()
+            self._mark_done()
+        except Exception as e:
+            self._mark_failed(e)
+
+    def _mark_done(self):
+        self.write({'state': 'done', 'date_done': fields.Datetime.now(), 'error_message': False})
+        self.env.cr.commit()
+
+    def _mark_failed(self, error):
+        """Roll back the job's changes, then schedule a retry or give up"""
+        self.env.cr.rollback()
+        _logger.error(f"学习集 {self.learning_set_id.id} 音频生成任务 {self.id} 失败 "
+                      f"(第 {self.attempt_count} 次): {str(error)}")
+        if self.attempt_count < AUDIO_JOB_MAX_ATTEMPTS:
+            delay = AUDIO_JOB_RETRY_DELAY * 2 ** (self.attempt_count - 1)
+            self.write({
+                'state': 'pending',
+                'next_attempt': fields.Datetime.now() + delay,
+                'error_message': str(error),
+            })
+        else:
+            self.write({'state': 'failed', 'date_done': fields.Datetime.now(), 'error_message': str(error)})
+        self.env.cr.commit()
+
+    @api.model
+    def _get_progress(self):
+        """Return the number of jobs per state"""
+        groups = self.read_group([], ['state'], ['state'])
+        return {group['state']: group['state_count'] for group in groups}
+
+    def _get_status_data(self):
+        """Return the JSON status of the job for the audio API"""
+        self.ensure_one()
+        audio_url = self.learning_set_id.audio_url if self.state == 'done' else False
+        return {
+            'jobId': self.id,
+            'learningSetId': self.learning_set_id.id,
+            'status': self.state,
+            'error': self.error_message or None,
+            'audioUrl': audio_url or None,
+        }
@@ -0,0 +1,89 @@
+from odoo import models, fields, api
+import re
+
+
+class LearningAudioSegment(models.Model):
+    """One TTS segment of a learning set audio file
+
+    Segments are not stored as separate files: the set audio is the
+    concatenation of all segments, and each segment records its byte range
+    and time range in it.
+    """
+    _name = 'learning.audio.segment'
+    _description = 'Learning Audio Segment'
+    _order = 'learning_set_id, sequence'
+
+    learning_set_id = fields.Many2one('learning.set', string='Learning Set', required=True,
+                                      ondelete='cascade', index=True)
+    sentence_id = fields.Many2one('learning.sentence', string='Sentence', ondelete='set null', index=True)
+    sequence = fields.Integer('Sequence', default=0)
+    text = fields.Text('Text')
+    start_offset = fields.Integer('Start Offset', help="First byte of the segment in the set audio file")
+    end_offset = fields.Integer('End Offset', help="Byte after the segment in the set audio file")
+    start_time = fields.Float('Start Time', digits=(16, 3), help="Seconds")
+    end_time = fields.Float('End Time', digits=(16, 3), help="Seconds")
+
+    @api.model
+    def _replace_for_set(self, learning_set, segment_index):
+        """Replace the segments of ``learning_set`` by ``segment_index`` and link them to sentences
+
+        :param segment_index: list of dicts with ``text``, ``start_offset``,
+            ``end_offset``, ``start_time`` and ``end_time``
+        """
+        self.sudo().search([('learning_set_id', '=', learning_set.id)]).unlink()
+        sentence_ids = self._match_sentences(learning_set, segment_index)
+        return self.sudo().create([
+            {
+                'learning_set_id': learning_set.id,
+                'sentence_id': sentence_id,
+                'sequence': sequence,
+                'text': segment.get('text'),
+                'start_offset': segment['start_offset'],
+                'end_offset': segment['end_offset'],
+                'start_time': segment['start_time'],
+                'end_time': segment['end_time'],
+            }
+            for sequence, (segment, sentence_id) in enumerate(zip(segment_index, sentence_ids))
+        ])
+
+    @api.model
+    def _match_sentences(self, learning_set, segment_index):
+        """Return the learning.sentence id (or False) of each segment
+
+        Segments are matched on their text when the API returned it, and
+        otherwise by position when there are as many segments as sentences.
+        """
+        sentences = learning_set.sentence_ids
+        by_text = {}
+        for sentence in sentences:
+            by_text.setdefault(self._normalize_text(learning_set, sentence.sentence), sentence.id)
+
+        matched = [by_text.get(self._normalize_text(learning_set, segment.get('text'))) or False
+                   for segment in segment_index]
+        if not any(matched) and len(segment_index) == len(sentences):
+            matched = sentences.ids
+        return matched
+
+    @api.model
+    def _normalize_text(self, learning_set, text):
+        """Compare texts the way they were sent to the TTS (symbols converted, case and punctuation ignored)"""
+        if not text:
+            return ''
+        text = learning_set._convert_symbols_to_words(text)
+        return re.sub(r'[^a-z0-9]+', ' ', text.lower()).strip()
+
+    def _get_index_data(self, base_url):
+        """Return the JSON timing index of the segments"""
+        return [
+            {
+                'sequence': segment.sequence,
+                'sentenceId': segment.sentence_id.sentence_id or None,
+                'text': segment.text or None,
+                'startOffset': segment.start_offset,
+                'endOffset': segment.end_offset,
+                'startTime': segment.start_time,
+                'endTime': segment.end_time,
+                'audioUrl': f"{base_url}/api/learning/audio/segment/{segment.id}",
+            }
+            for segment in self
+        ]
@@ -51,6 +51,26 @@ class LearningCollection(models.Model):
             else:
                 record.last_update = False
     
+    ai_job_ids = fields.One2many('learning.ai.job', 'collection_id', string='AI生成任务')
+    ai_job_count = fields.Integer('AI生成任务数', compute='_compute_ai_job_count')
+
+    def _compute_ai_job_count(self):
+        groups = self.env['learning.ai.job'].read_group(
+            [('collection_id', 'in', self.ids), ('state', 'in', ('pending', 'running'))],
+            ['collection_id'], ['collection_id'])
+        counts = {group['collection_id'][0]: group['collection_id_count'] for group in groups}
+        for record in self:
+            record.ai_job_count = counts.get(record.id, 0)
+
+    def action_ai_generate_sets(self):
+        """为合集中所有尚无内容的学习集创建后台AI生成任务"""
+        return self.set_ids.action_enqueue_ai_generation()
+
+    def action_view_ai_jobs(self):
+        action = self.env['ir.actions.act_window']._for_xml_id('learning_system.action_learning_ai_job')
+        action['domain'] = [('collection_id', 'in', self.ids)]
+        return action
+
     def name_get(self):
         result = []
         for record in self:
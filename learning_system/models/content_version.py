@@ -0,0 +1,164 @@
+from odoo import models, fields, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Default number of days deletions are kept for delta sync clients
+SYNC_RETENTION_DAYS = 30
+
+
+class LearningContentVersion(models.AbstractModel):
+    """Database-wide version of the learning content.
+
+    Every transaction that changes content inserts a row in an append-only
+    change log; the version is the epoch of the database with the highest
+    id and the number of rows of the log. It is transactional: a reader
+    only sees a new version together with the data that caused it. Writers
+    only insert, so concurrent commits never conflict on a shared row
+    (ids may be visible out of order, the row count still changes).
+    """
+    _name = 'learning.content.version'
+    _description = 'Learning Content Version'
+
+    _table_name = 'learning_content_version'
+    _change_table_name = 'learning_content_change'
+
+    def init(self):
+        self.env.cr.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self._table_name} (
+                id INTEGER PRIMARY KEY,
+                epoch VARCHAR NOT NULL
+            )
+        """)
+        # Counter of the versions before the change log
+        self.env.cr.execute(f"ALTER TABLE {self._table_name} DROP COLUMN IF EXISTS version")
+        # The epoch distinguishes counters of different databases/installs,
+        # so a restored database never reuses the ETags of another one.
+        self.env.cr.execute(f"""
+            INSERT INTO {self._table_name} (id, epoch)
+            VALUES (1, md5(random()::text || clock_timestamp()::text))
+            ON CONFLICT (id) DO NOTHING
+        """)
+        self.env.cr.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self._change_table_name} (
+                id BIGSERIAL PRIMARY KEY
+            )
+        """)
+
+    @api.model
+    def _get_version(self):
+        """Return the current content version token (e.g. 'a1b2c3...-42-17')"""
+        self.env.cr.execute(f"""
+            SELECT v.epoch, c.max_id, c.row_count
+              FROM {self._table_name} v,
+                   (SELECT COALESCE(max(id), 0) AS max_id, count(*) AS row_count
+                      FROM {self._change_table_name}) c
+             WHERE v.id = 1
+        """)
+        row = self.env.cr.fetchone()
+        if not row:
+            return '0'
+        return f"{row[0]}-{row[1]}-{row[2]}"
+
+    @api.model
+    def _bump(self):
+        """Change the content version when the current transaction commits
+
+        The change is logged by the pre-commit hooks, once per transaction
+        however many records were touched.
+        """
+        cr = self.env.cr
+        if cr.precommit.data.get('learning.content.version.bump'):
+            return
+        cr.precommit.data['learning.content.version.bump'] = True
+
+        table = self._change_table_name
+
+        @cr.precommit.add
+        def bump_version():
+            cr.execute(f"INSERT INTO {table} DEFAULT VALUES")
+
+    @api.model
+    def _gc_changes(self):
+        """Cron: empty the change log, under a new epoch
+
+        The epoch changes in the same transaction, so no version token
+        issued before can be produced again with fewer rows. An empty log
+        keeps its epoch, so unchanged content keeps its version (and ETags).
+        """
+        self.env.cr.execute(f"DELETE FROM {self._change_table_name}")
+        count = self.env.cr.rowcount
+        if not count:
+            return
+        self.env.cr.execute(f"""
+            UPDATE {self._table_name}
+               SET epoch = md5(random()::text || clock_timestamp()::text)
+             WHERE id = 1
+        """)
+        _logger.info("Removed %s learning content change log entries", count)
+
+
+class LearningTombstone(models.Model):
+    """Deletion log of learning content, used by the delta sync API"""
+    _name = 'learning.tombstone'
+    _description = 'Learning Content Tombstone'
+    _order = 'deleted_at, id'
+    _log_access = False
+
+    res_model = fields.Char('Model', required=True, index=True)
+    res_id = fields.Integer('Record ID', required=True)
+    # Transaction timestamp, like write_date, so both compare to sync tokens
+    deleted_at = fields.Datetime('Deleted At', required=True, index=True,
+                                 default=lambda self: self.env.cr.now())
+
+    @api.model
+    def _record(self, records):
+        """Log the deletion of ``records``"""
+        if records:
+            self.sudo().create([{'res_model': records._name, 'res_id': res_id} for res_id in records.ids])
+
+    @api.model
+    def _gc_tombstones(self):
+        """Cron: forget deletions older than the sync retention period"""
+        retention_days = int(self.env['ir.config_parameter'].sudo().get_param(
+            'learning_system.sync_retention_days', SYNC_RETENTION_DAYS))
+        self.env.cr.execute(
+            "DELETE FROM learning_tombstone WHERE deleted_at < (now() AT TIME ZONE 'UTC') - %s * interval '1 day'",
+            [retention_days])
+        _logger.info("Removed %s learning tombstones older than %s days", self.env.cr.rowcount, retention_days)
+
+
+class LearningContentMixin(models.AbstractModel):
+    """Track changes of exported learning content
+
+    Any change bumps the content version; deletions are also logged as
+    tombstones for the delta sync API.
+    """
+    _name = 'learning.content.mixin'
+    _description = 'Learning Content Mixin'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.env['learning.content.version']._bump()
+        return records
+
+    def write(self, vals):
+        result = super().write(vals)
+        if self:
+            self.env['learning.content.version']._bump()
+        return result
+
+    def unlink(self):
+        if self:
+            self.env['learning.content.version']._bump()
+            tombstones = self.env['learning.tombstone']
+            tombstones._record(self)
+            # Children removed by ON DELETE CASCADE never go through unlink()
+            for dependents in self._content_dependents():
+                tombstones._record(dependents)
+        return super().unlink()
+
+    def _content_dependents(self):
+        """Return the recordsets deleted in cascade together with ``self``"""
+        return []
@@ -6,6 +6,7 @@ class LearningCue(models.Model):
     _name = 'learning.cue'
     _description = 'Learning Cue'
     _order = 'vocabulary_id, sequence, id'
+    _inherit = ['learning.content.mixin']
 
     vocabulary_id = fields.Many2one('learning.vocabulary', string='Vocabulary', required=True, ondelete='cascade')
     cue_type_char = fields.Char('Cue Type', required=True, default='text',
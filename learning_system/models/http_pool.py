@@ -0,0 +1,80 @@
+"""Process-wide pooled HTTP sessions for the outbound TTS and AI provider calls
+
+One ``requests.Session`` per scheme and host keeps connections alive
+between calls, so repeated calls to a provider skip the TCP/TLS handshake.
+Sessions are thread-safe for this use (the connection pool is), so the
+worker threads of the audio jobs and AI generators share them.
+
+The pool size per host is read from the Odoo server configuration
+(``learning_http_pool_size`` in the config file, 10 by default).
+HTTP/2 is not used: requests/urllib3 only speak HTTP/1.1, and keep-alive
+already removes the per-call handshake.
+"""
+from odoo.tools import config
+from urllib.parse import urlsplit
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = 10
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _pool_size():
+    return int(config.get('learning_http_pool_size') or DEFAULT_POOL_SIZE)
+
+
+def get_session(url):
+    """Return the shared session of ``url``'s scheme and host"""
+    parts = urlsplit(url)
+    key = f"{parts.scheme}://{parts.netloc}"
+    session = _sessions.get(key)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                # Blocking pool: more concurrent calls than pool_size wait
+                # for a free connection instead of opening throw-away ones
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_pool_size(), pool_block=True)
+                session.mount(f"{parts.scheme}://", adapter)
+                _sessions[key] = session
+    return session
+
+
+def post(url, **kwargs):
+    return get_session(url).post(url, **kwargs)
+
+
+def get(url, **kwargs):
+    return get_session(url).get(url, **kwargs)
+
+
+def get_stats():
+    """Return the connection reuse statistics of this process, per host
+
+    ``connections`` is the number of connections opened, ``requests`` the
+    number of requests sent; every request above the connection count
+    reused a kept-alive connection.
+    """
+    stats = {}
+    with _sessions_lock:
+        sessions = list(_sessions.items())
+    for key, session in sessions:
+        connections = requests_count = 0
+        for adapter in session.adapters.values():
+            pools = adapter.poolmanager.pools
+            for pool_key in pools.keys():
+                pool = pools.get(pool_key)
+                if pool is not None:
+                    connections += pool.num_connections
+                    requests_count += pool.num_requests
+        if requests_count:
+            stats[key] = {
+                'connections': connections,
+                'requests': requests_count,
+                'reuse_ratio': round(1 - connections / requests_count, 3),
+            }
+    return stats
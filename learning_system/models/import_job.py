@@ -0,0 +1,223 @@
+from odoo import models, fields, api
+from .import_wizard import open_attachment_field, iter_json_sets, IMPORT_EXISTING_MODES
+from datetime import timedelta
+from itertools import islice
+import base64
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# A running job without checkpoint for this long is considered lost (worker killed)
+IMPORT_JOB_TIMEOUT = timedelta(minutes=15)
+# Default number of learning sets imported between two checkpoints (commits)
+IMPORT_JOB_CHECKPOINT_SETS = 50
+# Attempts of a job before it is marked as failed, and delay before the first retry
+IMPORT_JOB_MAX_ATTEMPTS = 3
+IMPORT_JOB_RETRY_DELAY = timedelta(minutes=1)
+# Default number of days finished jobs (and their uploaded file) are kept
+IMPORT_JOB_RETENTION_DAYS = 7
+
+
+class LearningImportJob(models.Model):
+    """Background import of a JSON learning data file
+
+    The file is read one learning set at a time and imported in chunks,
+    each under a savepoint and committed with a checkpoint (the number of
+    sets of the file already processed). A failed or interrupted job
+    resumes after its checkpoint. A set that cannot be imported is
+    reported and skipped, the others are still imported.
+    """
+    _name = 'learning.import.job'
+    _description = 'Learning Data Import Job'
+    _order = 'id desc'
+
+    name = fields.Char('Name', required=True, readonly=True)
+    json_file = fields.Binary('JSON File', attachment=True, readonly=True)
+    existing_mode = fields.Selection(IMPORT_EXISTING_MODES, string='Existing Sets', default='error',
+                                     required=True, readonly=True)
+    user_id = fields.Many2one('res.users', string='Requested By', readonly=True)
+    state = fields.Selection([
+        ('pending', '等待中'),
+        ('running', '导入中'),
+        ('done', '已完成'),
+        ('failed', '失败'),
+    ], string='Status', default='pending', required=True, index=True)
+    processed_count = fields.Integer('Processed Sets', default=0, readonly=True,
+                                     help="检查点：文件中已处理的学习集数量，任务从此处继续")
+    imported_count = fields.Integer('Imported Sets', default=0, readonly=True)
+    error_count = fields.Integer('Failed Sets', default=0, readonly=True)
+    error_report = fields.Text('Error Report', readonly=True, help="无法导入的学习集及其错误，每行一个")
+    error_message = fields.Text('Error Message')
+    attempt_count = fields.Integer('Attempts', default=0)
+    next_attempt = fields.Datetime('Next Attempt', help="Retry not before this time")
+    date_started = fields.Datetime('Started At')
+    date_checkpoint = fields.Datetime('Last Checkpoint')
+    date_done = fields.Datetime('Finished At')
+
+    @api.model
+    def _enqueue(self, wizard):
+        """Create the import job of the file or text of the import ``wizard``"""
+        job = self.sudo().create({
+            'name': wizard.import_mode == 'file' and wizard.json_filename or 'JSON 文本',
+            'existing_mode': wizard.existing_mode,
+            'user_id': self.env.uid,
+        })
+        if wizard.import_mode == 'file':
+            # Hand the uploaded file over to the job, without copying it
+            attachment = self.env['ir.attachment'].sudo().search([
+                ('res_model', '=', wizard._name),
+                ('res_field', '=', 'json_file'),
+                ('res_id', '=', wizard.id),
+            ], limit=1)
+            attachment.write({'res_model': self._name, 'res_id': job.id})
+        else:
+            job.json_file = base64.b64encode(wizard.json_text.encode('utf-8'))
+        self.env.ref('learning_system.ir_cron_learning_import_job')._trigger()
+        _logger.info(f"JSON 导入任务已加入队列: {job.id} ({job.name})")
+        return job
+
+    @api.model
+    def _process_jobs(self, limit=1):
+        """Cron: import pending files, one job at a time"""
+        cr = self.env.cr
+        cr.execute("""
+            UPDATE learning_import_job SET state = 'pending', date_started = NULL
+            WHERE state = 'running' AND date_checkpoint < (now() AT TIME ZONE 'UTC') - %s
+        """, [IMPORT_JOB_TIMEOUT])
+        if cr.rowcount:
+            _logger.warning(f"{cr.rowcount} 个超时的导入任务已重新排队，将从检查点继续")
+        cr.commit()
+
+        for _i in range(limit):
+            job = self._claim()
+            if not job:
+                break
+            job._run()
+
+        # More jobs may be waiting (or scheduled for a retry): run again for them
+        cron = self.env.ref('learning_system.ir_cron_learning_import_job')
+        if self.search_count([('state', '=', 'pending'), ('next_attempt', '=', False)]):
+            cron._trigger()
+        else:
+            retry_job = self.search([('state', '=', 'pending')], order='next_attempt', limit=1)
+            if retry_job:
+                cron._trigger(retry_job.next_attempt)
+
+    @api.model
+    def _claim(self):
+        """Lock a due pending job, mark it running and commit"""
+        cr = self.env.cr
+        cr.execute("""
+            SELECT id FROM learning_import_job
+            WHERE state = 'pending'
+              AND (next_attempt IS NULL OR next_attempt <= now() AT TIME ZONE 'UTC')
+            ORDER BY id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        """)
+        row = cr.fetchone()
+        job = self.browse(row[0] if row else [])
+        if job:
+            job.write({
+                'state': 'running',
+                'date_started': fields.Datetime.now(),
+                'date_checkpoint': fields.Datetime.now(),
+                'attempt_count': job.attempt_count + 1,
+            })
+        cr.commit()
+        return job
+
+    def _run(self):
+        """Import the learning sets of the file after the checkpoint"""
+        self.ensure_one()
+        checkpoint_sets = max(1, int(self.env['ir.config_parameter'].sudo().get_param(
+            'learning_system.import_checkpoint_sets', IMPORT_JOB_CHECKPOINT_SETS)))
+        with open_attachment_field(self, 'json_file') as binary_file:
+            set_items = iter_json_sets(binary_file)
+            try:
+                # The sets before the checkpoint are committed: only parse them
+                set_items_left = islice(set_items, self.processed_count, None)
+                while True:
+                    chunk = list(islice(set_items_left, checkpoint_sets))
+                    if not chunk:
+                        break
+                    self._import_chunk(chunk)
+                self.write({'state': 'done', 'date_done': fields.Datetime.now(), 'error_message': False})
+                self.env.cr.commit()
+                _logger.info(f"JSON 导入任务 {self.id} 完成: 导入 {self.imported_count} 个学习集，"
+                             f"失败 {self.error_count} 个")
+            except Exception as e:
+                self._mark_failed(e)
+            finally:
+                set_items.close()
+
+    def _import_chunk(self, set_items):
+        """Import the ``(name, data)`` pairs ``set_items``, then commit them with the checkpoint
+
+        The chunk is imported with one batch of creates; if that fails, its
+        sets are imported one by one, each under a savepoint, to report the
+        failing ones and keep the others.
+        """
+        self.ensure_one()
+        learning_sets = self.env['learning.set']
+        errors = []
+        try:
+            with self.env.cr.savepoint():
+                learning_sets._import_json_set_batch(set_items, self.existing_mode)
+        except Exception:
+            for set_name, set_data in set_items:
+                try:
+                    with self.env.cr.savepoint():
+                        learning_sets._import_json_set_batch([(set_name, set_data)], self.existing_mode)
+                except Exception as e:
+                    errors.append(f"{set_name}: {str(e)}")
+
+        self.write({
+            'processed_count': self.processed_count + len(set_items),
+            'imported_count': self.imported_count + len(set_items) - len(errors),
+            'error_count': self.error_count + len(errors),
+            'error_report': '\n'.join(filter(None, [self.error_report] + errors)) or False,
+            'date_checkpoint': fields.Datetime.now(),
+        })
+        self.env.cr.commit()
+        if errors:
+            _logger.warning(f"JSON 导入任务 {self.id}: {len(errors)} 个学习集导入失败")
+
+    def _mark_failed(self, error):
+        """Roll back to the last checkpoint, then schedule a retry or give up"""
+        self.env.cr.rollback()
+        _logger.error(f"JSON 导入任务 {self.id} 失败 (第 {self.attempt_count} 次, "
+                      f"检查点 {self.processed_count}): {str(error)}")
+        if self.attempt_count < IMPORT_JOB_MAX_ATTEMPTS:
+            delay = IMPORT_JOB_RETRY_DELAY * 2 ** (self.attempt_count - 1)
+            self.write({
+                'state': 'pending',
+                'next_attempt': fields.Datetime.now() + delay,
+                'error_message': str(error),
+            })
+        else:
+            self.write({'state': 'failed', 'date_done': fields.Datetime.now(), 'error_message': str(error)})
+        self.env.cr.commit()
+
+    @api.model
+    def _gc_jobs(self):
+        """Cron: delete the jobs finished for the retention period, with their uploaded file"""
+        retention_days = int(self.env['ir.config_parameter'].sudo().get_param(
+            'learning_system.import_job_retention_days', IMPORT_JOB_RETENTION_DAYS))
+        self.env.cr.execute("""
+            SELECT id FROM learning_import_job
+            WHERE state IN ('done', 'failed') AND date_done < (now() AT TIME ZONE 'UTC') - %s * interval '1 day'
+        """, [retention_days])
+        jobs = self.sudo().browse([row[0] for row in self.env.cr.fetchall()])
+        jobs.unlink()
+        _logger.info("Removed %s learning import jobs finished more than %s days ago", len(jobs), retention_days)
+
+    def action_retry(self):
+        """Resume failed jobs from their checkpoint (UI action)"""
+        self.filtered(lambda job: job.state == 'failed').write({
+            'state': 'pending',
+            'attempt_count': 0,
+            'next_attempt': False,
+            'error_message': False,
+        })
+        self.env.ref('learning_system.ir_cron_learning_import_job')._trigger()
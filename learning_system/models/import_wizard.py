@@ -1,7 +1,38 @@
 from odoo import models, fields, api
 from odoo.exceptions import UserError
+from .json_stream import iter_json_object_items
+import io
 import json
-import base64
+
+# Learning sets detailed in the preview, the others are only counted
+PREVIEW_SET_COUNT = 20
+# Handling of the learning sets of a file that already exist (see LearningSet._import_json_sets)
+IMPORT_EXISTING_MODES = [
+    ('error', '报错，不导入'),
+    ('replace', '删除后重新创建'),
+    ('update', '按差异更新'),
+]
+
+
+def open_attachment_field(record, field_name):
+    """Return the content of the attachment Binary field ``field_name`` of ``record`` as a binary file object"""
+    attachment = record.env['ir.attachment'].sudo().search([
+        ('res_model', '=', record._name),
+        ('res_field', '=', field_name),
+        ('res_id', '=', record.id),
+    ], limit=1)
+    if attachment.store_fname:
+        return open(attachment._full_path(attachment.store_fname), 'rb')
+    return io.BytesIO(attachment.raw or b'')
+
+
+def iter_json_sets(binary_file):
+    """Yield the ``(name, data)`` learning sets of the JSON ``binary_file``, parsed one at a time"""
+    with io.TextIOWrapper(binary_file, encoding='utf-8-sig') as json_data:
+        try:
+            yield from iter_json_object_items(json_data)
+        except UnicodeDecodeError:
+            raise UserError("文件编码不支持，请使用 UTF-8 编码的文件")
 
 
 class LearnimportWizard(models.TransientModel):
@@ -9,7 +40,8 @@ class LearnimportWizard(models.TransientModel):
     _description = 'Learning Data Import Wizard'
 
     name = fields.Char('向导名称', default='JSON 数据导入', readonly=True)
-    json_file = fields.Binary('JSON 文件', required=True, help="选择要导入的 JSON 文件")
+    # Kept in the filestore, so the import can read the file in chunks
+    json_file = fields.Binary('JSON 文件', attachment=True, help="选择要导入的 JSON 文件")
     json_filename = fields.Char('文件名')
     json_text = fields.Text('JSON 文本', help="或者直接粘贴 JSON 内容")
     import_mode = fields.Selection([
@@ -22,31 +54,31 @@ class LearnimportWizard(models.TransientModel):
     show_preview = fields.Boolean('显示预览', default=False)
     
     # Import options
-    overwrite_existing = fields.Boolean('覆盖已存在的学习集', default=False, 
-                                       help="如果启用，将删除同名的现有学习集并重新创建")
+    existing_mode = fields.Selection(IMPORT_EXISTING_MODES, string='已存在的学习集', default='error', required=True,
+                                     help="删除后重新创建：删除同名的现有学习集及其全部数据并重新创建；"
+                                          "按差异更新：按单词匹配词汇、按 Sentence ID 匹配句子、按类型和内容匹配线索，"
+                                          "只写入变化的字段，只删除文件中已不存在的数据")
     
     def action_preview_data(self):
         """Preview the JSON data before import"""
         try:
-            json_data = self._get_json_data()
-            
-            # Parse and validate JSON
-            if isinstance(json_data, str):
-                data = json.loads(json_data)
-            else:
-                data = json_data
-            
             # Create preview summary
             preview_lines = []
             preview_lines.append("=== 数据预览 ===\n")
-            
-            for set_name, set_data in data.items():
+
+            set_count = vocab_total = sentence_total = 0
+            for set_name, set_data in self._iter_json_sets():
+                vocab_count = len(set_data.get('vocabulary', []))
+                sentence_count = len(set_data.get('sentences', []))
+                set_count += 1
+                vocab_total += vocab_count
+                sentence_total += sentence_count
+                if set_count > PREVIEW_SET_COUNT:
+                    continue
+
                 preview_lines.append(f"学习集: {set_name}")
                 preview_lines.append(f"  描述: {set_data.get('description', '无')}")
                 preview_lines.append(f"  用户: {set_data.get('user', 'public')}")
-                
-                vocab_count = len(set_data.get('vocabulary', []))
-                sentence_count = len(set_data.get('sentences', []))
                 preview_lines.append(f"  词汇数量: {vocab_count}")
                 preview_lines.append(f"  句子数量: {sentence_count}")
                 
@@ -69,6 +101,10 @@ class LearnimportWizard(models.TransientModel):
                         preview_lines.append(f"    - {title}: {text}")
                 
                 preview_lines.append("")
+
+            if set_count > PREVIEW_SET_COUNT:
+                preview_lines.append(f"... 另有 {set_count - PREVIEW_SET_COUNT} 个学习集未显示\n")
+            preview_lines.append(f"合计: {set_count} 个学习集，词汇 {vocab_total} 个，句子 {sentence_total} 个")
             
             self.preview_data = '\n'.join(preview_lines)
             self.show_preview = True
@@ -88,74 +124,45 @@ class LearnimportWizard(models.TransientModel):
             raise UserError(f"预览失败: {str(e)}")
 
     def action_import_data(self):
-        """Import the JSON data"""
-        try:
-            json_data = self._get_json_data()
-            
-            # Parse JSON
-            if isinstance(json_data, str):
-                data = json.loads(json_data)
-            else:
-                data = json_data
-            
-            # Check for existing learning sets if overwrite is disabled
-            if not self.overwrite_existing:
-                existing_sets = []
-                for set_name in data.keys():
-                    existing = self.env['learning.set'].search([('name', '=', set_name)], limit=1)
-                    if existing:
-                        existing_sets.append(set_name)
-                
-                if existing_sets:
-                    raise UserError(f"以下学习集已存在: {', '.join(existing_sets)}。请启用'覆盖已存在的学习集'选项或手动删除现有数据。")
-            
-            # Delete existing sets if overwrite is enabled
-            if self.overwrite_existing:
-                for set_name in data.keys():
-                    existing = self.env['learning.set'].search([('name', '=', set_name)])
-                    if existing:
-                        existing.unlink()
-            
-            # Import data using the learning.set model method
-            result = self.env['learning.set'].import_from_json_data(data)
-            
-            # Show success message
-            return {
-                'type': 'ir.actions.client',
-                'tag': 'display_notification',
-                'params': {
-                    'title': '导入成功',
-                    'message': result['message'],
-                    'type': 'success',
-                    'sticky': False,
-                }
+        """Queue the import of the JSON data as a background job"""
+        self.ensure_one()
+        if self.import_mode == 'file':
+            # bin_size: check the upload without loading its content
+            if not self.with_context(bin_size=True).json_file:
+                raise UserError("请选择要导入的 JSON 文件")
+        elif not self.json_text:
+            raise UserError("请输入 JSON 文本内容")
+
+        job = self.env['learning.import.job']._enqueue(self)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': '导入任务已创建',
+                'message': f"{job.name} 将在后台导入，进度见「配置 → 数据导入任务」",
+                'type': 'info',
+                'sticky': False,
+                'next': {'type': 'ir.actions.act_window_close'},
             }
-            
-        except Exception as e:
-            raise UserError(f"导入失败: {str(e)}")
+        }
+
+    def _iter_json_sets(self):
+        """Yield the ``(name, data)`` learning sets of the JSON file or text, parsed one at a time"""
+        return iter_json_sets(self._open_json_data())
 
-    def _get_json_data(self):
-        """Get JSON data from file or text input"""
+    def _open_json_data(self):
+        """Return a binary file object of the JSON file or text input"""
+        self.ensure_one()
         if self.import_mode == 'file':
-            if not self.json_file:
+            # bin_size: check the upload without loading its content
+            if not self.with_context(bin_size=True).json_file:
                 raise UserError("请选择要导入的 JSON 文件")
-            
-            # Decode base64 file content
-            file_content = base64.b64decode(self.json_file)
-            try:
-                json_data = file_content.decode('utf-8')
-            except UnicodeDecodeError:
-                try:
-                    json_data = file_content.decode('utf-8-sig')  # Handle BOM
-                except UnicodeDecodeError:
-                    raise UserError("文件编码不支持，请使用 UTF-8 编码的文件")
-            
-            return json_data
-        
+            return open_attachment_field(self, 'json_file')
+
         elif self.import_mode == 'text':
             if not self.json_text:
                 raise UserError("请输入 JSON 文本内容")
-            return self.json_text
+            return io.BytesIO(self.json_text.encode('utf-8'))
         
         else:
             raise UserError("无效的导入模式")
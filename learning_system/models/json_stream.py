@@ -0,0 +1,195 @@
+"""Incremental parsing of JSON received or read in chunks
+
+``iter_sse_data`` reads the Server-Sent Events of a streamed provider
+response, and ``JsonArrayParser`` returns the objects of the JSON array in
+the completion as soon as each one is complete, without waiting for the
+end of the text. ``iter_json_object_items`` reads the members of a large
+JSON object (a learning data file) from a file one at a time.
+"""
+import json
+import re
+
+# Characters read from a file at once by iter_json_object_items
+JSON_READ_SIZE = 1 << 16
+# Largest JSON value (one learning set) iter_json_object_items buffers, in characters
+JSON_MAX_VALUE_SIZE = 1 << 26
+
+_WHITESPACE_RE = re.compile(r'[ \t\n\r]*')
+
+
+def iter_sse_data(lines):
+    """Yield the ``data`` of each Server-Sent Event read from ``lines`` (decoded text lines)"""
+    data = []
+    for line in lines:
+        if line is None:
+            continue
+        if not line:
+            # A blank line ends the event
+            if data:
+                yield '\n'.join(data)
+                data = []
+            continue
+        if line.startswith(':'):
+            continue
+        field, _sep, value = line.partition(':')
+        if field == 'data':
+            data.append(value[1:] if value.startswith(' ') else value)
+    if data:
+        yield '\n'.join(data)
+
+
+class JsonArrayParser:
+    """Parse the first JSON array of objects of a text fed in chunks
+
+    Text around the array (explanations, markdown code fences) is skipped:
+    the array starts at the first ``[`` followed by ``{`` or ``]``. Each
+    object is returned by ``feed`` as soon as its closing brace arrives.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self._bracket_seen = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buffer = []
+
+    def feed(self, chunk):
+        """Return the list of objects completed by ``chunk``"""
+        items = []
+        for char in chunk:
+            if self.finished:
+                break
+            if not self.started:
+                if not self._bracket_seen:
+                    self._bracket_seen = char == '['
+                    continue
+                if char.isspace():
+                    continue
+                if char == ']':
+                    self.started = self.finished = True
+                    continue
+                if char != '{':
+                    self._bracket_seen = char == '['
+                    continue
+                self.started = True
+
+            if not self._depth:
+                # Between two elements of the array
+                if char == '{':
+                    self._depth = 1
+                    self._buffer = [char]
+                elif char == ']':
+                    self.finished = True
+                continue
+
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if not self._depth:
+                    items.append(json.loads(''.join(self._buffer)))
+                    self._buffer = []
+        return items
+
+
+def iter_json_object_items(stream, chunk_size=JSON_READ_SIZE, max_value_size=JSON_MAX_VALUE_SIZE):
+    """Yield the ``(key, value)`` members of the JSON object read from the text ``stream``
+
+    Only the member being parsed is held in memory, not the whole
+    document. Raises ``json.JSONDecodeError`` on invalid JSON, or on a
+    value larger than ``max_value_size`` characters.
+    """
+    reader = _JsonReader(stream, chunk_size, max_value_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        reader.pos += 1
+    else:
+        while True:
+            key = reader.decode()
+            if not isinstance(key, str):
+                raise reader.error("Expecting property name enclosed in double quotes")
+            reader.expect(':')
+            yield key, reader.decode()
+            if reader.expect(',}') == '}':
+                break
+    if reader.peek():
+        raise reader.error("Extra data")
+
+
+class _JsonReader:
+    """Buffer of the text of a stream, consumed by iter_json_object_items"""
+
+    def __init__(self, stream, chunk_size, max_value_size):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.max_value_size = max_value_size
+        self.decoder = json.JSONDecoder()
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def read(self, size=0):
+        """Drop the consumed text and append at least ``size`` characters; return False at end of stream"""
+        if self.eof:
+            return False
+        chunk = self.stream.read(max(size, self.chunk_size))
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+        return not self.eof
+
+    def peek(self):
+        """Skip whitespace and return the next character, or '' at the end of the stream"""
+        while True:
+            self.pos = _WHITESPACE_RE.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self.read():
+                return ''
+
+    def expect(self, chars):
+        """Consume the next character, which must be one of ``chars``, and return it"""
+        char = self.peek()
+        if not char or char not in chars:
+            raise self.error(f"Expecting one of {chars!r}")
+        self.pos += 1
+        return char
+
+    def decode(self):
+        """Consume and return the next JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError as e:
+                # Cut by the end of the buffer: read as much again as is buffered,
+                # so a large value is parsed a logarithmic number of times.
+                # Any other error is in the text already read: no need to read further.
+                cut = e.pos >= len(self.text) - self.chunk_size or e.msg.startswith('Unterminated string')
+                if not cut:
+                    raise
+                if len(self.text) - self.pos >= self.max_value_size:
+                    raise self.error(f"JSON value larger than {self.max_value_size} characters") from e
+                if not self.read(len(self.text) - self.pos):
+                    raise
+                continue
+            if end == len(self.text) and self.read():
+                # A number may continue in the next chunk
+                continue
+            self.pos = end
+            return value
+
+    def error(self, message):
+        return json.JSONDecodeError(message, self.text, self.pos)
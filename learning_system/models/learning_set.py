@@ -1,15 +1,109 @@
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError, UserError
+from odoo.tools import float_compare
+from .content_version import SYNC_RETENTION_DAYS
+from .mp3_utils import mp3_duration, strip_id3
+from .tts_client import fetch_tts_segments, TTS_API_URL, TTS_PARAMS
+from collections import defaultdict
+from datetime import datetime, timedelta
 import json
-import base64
+import logging
 import requests
 
+_logger = logging.getLogger(__name__)
+
+# Payload keys of the bulk export engine (see LearningSet.export_to_json),
+# in output order, with the model fields each of them is built from
+EXPORT_SET_KEYS = {
+    'fullText': ['full_text'],
+    'description': ['description'],
+    'user': ['user'],
+    'audioUrl': ['audio_file', 'audio_filename'],
+    'audioFilename': ['audio_filename'],
+    'vocabulary': [],
+    'sentences': [],
+}
+EXPORT_VOCABULARY_KEYS = {
+    'word': ['word'],
+    'cues': [],
+    'translation': ['translation'],
+    'example': ['example'],
+    'commonMistake': ['common_mistake'],
+    'lambda': ['lambda_value'],
+}
+EXPORT_SENTENCE_KEYS = {
+    'id': ['sentence_id'],
+    'title': ['title'],
+    'sentence': ['sentence'],
+    'prediction': ['prediction_question', 'wrong_options', 'correct_answer', 'explanation'],
+    'grammar': ['grammar_pattern', 'grammar_breakdown'],
+    'lambda': ['lambda_value'],
+}
+EXPORT_CUE_FIELDS = ['vocabulary_id', 'cue_type_char', 'text', 'strength']
+# Number of learning sets serialized per grouped read when streaming
+EXPORT_STREAM_BATCH_SIZE = 50
+# Number of learning sets created per batch of inserts by the JSON import
+IMPORT_BATCH_SIZE = 50
+EXPORT_NESTED_KEYS = {
+    'vocabulary': EXPORT_VOCABULARY_KEYS,
+    'sentences': EXPORT_SENTENCE_KEYS,
+}
+# Fields read by the delta sync API (see LearningSet.get_changes_api)
+SYNC_SET_FIELDS = ['name', 'sequence'] + [field for fields in EXPORT_SET_KEYS.values() for field in fields]
+SYNC_VOCABULARY_FIELDS = ['learning_set_id', 'sequence', 'active'] + [
+    field for fields in EXPORT_VOCABULARY_KEYS.values() for field in fields]
+SYNC_CUE_FIELDS = EXPORT_CUE_FIELDS + ['sequence', 'active']
+SYNC_SENTENCE_FIELDS = ['learning_set_id', 'sequence', 'active'] + [
+    field for fields in EXPORT_SENTENCE_KEYS.values() for field in fields]
+SYNC_DELETED_KEYS = {
+    'learning.set': 'sets',
+    'learning.vocabulary': 'vocabulary',
+    'learning.cue': 'cues',
+    'learning.sentence': 'sentences',
+}
+# Overlap between two syncs, on top of the oldest running transaction
+SYNC_SAFETY_MARGIN = timedelta(seconds=60)
+
+
+def _group_by_key(records, key):
+    """Return ``{key(record): [records]}``, to match imported items with existing records"""
+    groups = defaultdict(list)
+    for record in records:
+        groups[key(record)].append(record)
+    return groups
+
+
+def _pop_match(groups, key):
+    """Remove and return the first record of ``groups`` matching ``key``, or None"""
+    matches = groups.get(key)
+    return matches.pop(0) if matches else None
+
+
+def _write_changed(record, vals):
+    """Write the values of ``vals`` that differ from those of ``record``"""
+    changed = {}
+    for name, value in vals.items():
+        field = record._fields[name]
+        current = record[name]
+        if field.type in ('char', 'text'):
+            is_changed = (current or '') != (value or '')
+        elif field.type == 'integer':
+            is_changed = current != int(value or 0)
+        elif field.type == 'float':
+            is_changed = float_compare(current, float(value or 0.0), precision_digits=6) != 0
+        else:
+            is_changed = current != value
+        if is_changed:
+            changed[name] = value
+    if changed:
+        record.write(changed)
+
 
 class LearningSet(models.Model):
     _name = 'learning.set'
     _description = 'Learning Set'
     _order = 'sequence, name'
-    _inherit = ['mail.thread', 'mail.activity.mixin']
+    _inherit = ['mail.thread', 'mail.activity.mixin', 'learning.content.mixin']
 
     name = fields.Char('Name', required=True, help="Internal name for the learning set", tracking=True)
     description = fields.Char('Description', required=True, help="Display name for users", tracking=True)
@@ -20,11 +114,13 @@ class LearningSet(models.Model):
     active = fields.Boolean('Active', default=True, tracking=True)
 
     # MP3 Audio file
-    audio_file = fields.Binary('Audio File (MP3)', help="Upload MP3 audio file for this learning set")
+    # Stored in the filestore so it can be streamed (and X-Sendfile'd) without loading it
+    audio_file = fields.Binary('Audio File (MP3)', attachment=True, help="Upload MP3 audio file for this learning set")
     audio_filename = fields.Char('Audio Filename', help="Name of the uploaded audio file")
     audio_url = fields.Char('Audio URL', compute='_compute_audio_url', help="URL to access the audio file")
 
     # Related fields
+    audio_segment_ids = fields.One2many('learning.audio.segment', 'learning_set_id', string='Audio Segments')
     vocabulary_ids = fields.One2many('learning.vocabulary', 'learning_set_id', string='Vocabulary')
     sentence_ids = fields.One2many('learning.sentence', 'learning_set_id', string='Sentences')
 
@@ -42,8 +138,9 @@ class LearningSet(models.Model):
     @api.depends('audio_file', 'audio_filename')
     def _compute_audio_url(self):
         """Compute URL for accessing the audio file"""
-        for record in self:
-            if record.audio_file and record.audio_filename:
+        # bin_size: only test whether there is audio, without reading the file
+        for record, sized in zip(self, self.with_context(bin_size=True)):
+            if sized.audio_file and record.audio_filename:
                 base_url = self.env['ir.config_parameter'].sudo().get_param('web.base.url')
                 # 使用公开的API接口访问音频文件，避免认证和CORS问题
                 record.audio_url = f"{base_url}/api/learning/audio/{record.id}"
@@ -53,84 +150,449 @@ class LearningSet(models.Model):
     @api.constrains('audio_file', 'audio_filename')
     def _check_audio_file(self):
         """Validate that uploaded file is MP3 format"""
-        for record in self:
+        for record in self.with_context(bin_size=True):
             if record.audio_file and record.audio_filename:
                 if not record.audio_filename.lower().endswith('.mp3'):
                     raise ValidationError("只支持上传MP3格式的音频文件")
 
-    def export_to_json(self):
-        """Export learning set to JSON format compatible with React app"""
+    def write(self, vals):
+        result = super().write(vals)
+        if 'audio_file' in vals:
+            # Uploaded audio: the timing index of the generated one no longer applies
+            self.audio_segment_ids.sudo().unlink()
+        return result
+
+    def _get_audio_attachment(self):
+        """Return the ir.attachment holding the audio file of this learning set"""
+        self.ensure_one()
+        return self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_field', '=', 'audio_file'),
+            ('res_id', '=', self.id),
+        ], limit=1)
+
+    def _set_audio_content(self, content, filename):
+        """Store raw MP3 bytes as the audio file, without the base64 round trip of the field"""
+        self.ensure_one()
+        attachment = self._get_audio_attachment()
+        if attachment:
+            attachment.write({'raw': content})
+        else:
+            self.env['ir.attachment'].sudo().create({
+                'name': 'audio_file',
+                'res_model': self._name,
+                'res_field': 'audio_file',
+                'res_id': self.id,
+                'type': 'binary',
+                'raw': content,
+            })
+        self.invalidate_recordset(['audio_file'])
+        self.write({'audio_filename': filename})
+
+    def _content_dependents(self):
+        domain = [('learning_set_id', 'in', self.ids)]
+        return [
+            self.env[model].with_context(active_test=False).search(domain)
+            for model in ('learning.vocabulary', 'learning.cue', 'learning.sentence')
+        ]
+
+    def export_to_json(self, fields=None):
+        """Export learning set to JSON format compatible with React app
+
+        Sets, vocabulary, cues and sentences are each fetched with a single
+        grouped read, so the number of queries does not depend on the number
+        of learning sets being exported.
+
+        :param fields: optional projection, a list (or comma separated string)
+            of payload keys such as ``['description', 'vocabulary.word']``;
+            relations that are not requested are not read at all
+        """
+        if not self:
+            return {}
+
+        projection = self._parse_export_fields(fields)
+        set_keys = self._export_projected_keys(projection, EXPORT_SET_KEYS)
+
+        read_fields = ['name'] + [field for key in set_keys for field in EXPORT_SET_KEYS[key]]
+        set_rows = self.with_context(bin_size=True).read(list(dict.fromkeys(read_fields)), load=None)
+        base_url = self.env['ir.config_parameter'].sudo().get_param('web.base.url')
+
+        vocabulary_by_set = {}
+        if 'vocabulary' in set_keys:
+            vocabulary_keys = self._export_projected_keys(projection and projection['vocabulary'], EXPORT_VOCABULARY_KEYS)
+            vocabulary_by_set = self._export_vocabulary_by_set(vocabulary_keys)
+        sentences_by_set = {}
+        if 'sentences' in set_keys:
+            sentence_keys = self._export_projected_keys(projection and projection['sentences'], EXPORT_SENTENCE_KEYS)
+            sentences_by_set = self._export_sentences_by_set(sentence_keys)
+
         result = {}
-        for learning_set in self:
-            # Export vocabulary
-            vocabulary_data = []
-            for vocab in learning_set.vocabulary_ids:
-                cues_data = []
-                for cue in vocab.cue_ids:
-                    cues_data.append({
-                        'type': cue.cue_type_char,
-                        'text': cue.text,
-                        'strength': cue.strength
-                    })
-
-                vocabulary_data.append({
-                    'word': vocab.word,
-                    'cues': cues_data,
-                    'translation': vocab.translation,
-                    'example': vocab.example,
-                    'commonMistake': vocab.common_mistake,
-                    'lambda': vocab.lambda_value
-                })
-
-            # Export sentences
-            sentences_data = []
-            for sentence in learning_set.sentence_ids:
-                prediction_data = {
-                    'question': sentence.prediction_question,
-                    'wrongOptions': sentence.wrong_options.split('\n') if sentence.wrong_options else [],
-                    'correctAnswer': sentence.correct_answer,
-                    'explanation': sentence.explanation
-                }
+        for row in set_rows:
+            set_data = self._export_set_values(
+                row, base_url, vocabulary_by_set.get(row['id'], []), sentences_by_set.get(row['id'], []))
+            result[row['name']] = self._export_project(set_data, set_keys, EXPORT_SET_KEYS)
+
+        return result
+
+    def _export_unique_ids(self):
+        """Return the ids whose data ends up in :meth:`export_to_json`
+
+        export_to_json is keyed by name: a duplicated name keeps the position
+        of its first occurrence and the data of its last one.
+        """
+        set_ids_by_name = {}
+        for row in self.read(['name'], load=None):
+            set_ids_by_name[row['name']] = row['id']
+        return list(set_ids_by_name.values())
+
+    def _iter_export_items(self, fields=None, batch_size=EXPORT_STREAM_BATCH_SIZE):
+        """Yield the ``(name, data)`` items of :meth:`export_to_json` incrementally
+
+        Only ``batch_size`` learning sets are ever loaded at once.
+        """
+        set_ids = self._export_unique_ids()
+        for start in range(0, len(set_ids), batch_size):
+            batch = self.browse(set_ids[start:start + batch_size])
+            yield from batch.export_to_json(fields=fields).items()
+            # Keep memory flat: drop the records of this batch from the cache
+            self.env.invalidate_all()
+
+    def _iter_export_json(self, fields=None, batch_size=EXPORT_STREAM_BATCH_SIZE):
+        """Serialize :meth:`export_to_json` incrementally, one learning set at a time
 
+        The concatenated chunks are byte-for-byte identical to
+        ``json.dumps(self.export_to_json(fields), indent=2, ensure_ascii=False)``.
+        """
+        separator = '{\n  '
+        for name, set_data in self._iter_export_items(fields=fields, batch_size=batch_size):
+            value = json.dumps(set_data, indent=2, ensure_ascii=False).replace('\n', '\n  ')
+            yield f"{separator}{json.dumps(name, ensure_ascii=False)}: {value}"
+            separator = ',\n  '
+
+        yield '{}' if separator == '{\n  ' else '\n}'
+
+    @api.model
+    def _parse_export_fields(self, fields):
+        """Parse an export projection into ``{set key: None or set of sub keys}``
+
+        ``None`` means "everything", both for the whole projection and for
+        the sub keys of ``vocabulary``/``sentences``.
+        """
+        if fields is None:
+            return None
+        if isinstance(fields, str):
+            fields = fields.split(',')
+
+        projection = {}
+        for path in fields:
+            path = path.strip()
+            if not path:
+                continue
+            key, _sep, sub_key = path.partition('.')
+            if key not in EXPORT_SET_KEYS:
+                raise UserError(f"未知的导出字段: {path}")
+            if not sub_key:
+                projection[key] = None
+                continue
+            if sub_key not in EXPORT_NESTED_KEYS.get(key, {}):
+                raise UserError(f"未知的导出字段: {path}")
+            if key in projection and projection[key] is None:
+                continue
+            projection.setdefault(key, set()).add(sub_key)
+        return projection
+
+    @api.model
+    def _export_projected_keys(self, projection, all_keys):
+        """Return the keys of ``all_keys`` selected by ``projection``, in output order"""
+        if projection is None:
+            return list(all_keys)
+        return [key for key in all_keys if key in projection]
+
+    @api.model
+    def _export_project(self, values, keys, all_keys):
+        """Drop the keys of ``values`` that are not part of the projection"""
+        if len(keys) == len(all_keys):
+            return values
+        return {key: values[key] for key in keys}
+
+    def _export_vocabulary_by_set(self, keys=None):
+        """Return exported vocabulary (with cues) grouped by learning set id"""
+        keys = keys if keys is not None else list(EXPORT_VOCABULARY_KEYS)
+        read_fields = ['learning_set_id'] + [field for key in keys for field in EXPORT_VOCABULARY_KEYS[key]]
+        vocab_rows = self.env['learning.vocabulary'].search_read(
+            [('learning_set_id', 'in', self.ids)], read_fields, load=None)
+        if not vocab_rows:
+            return {}
+
+        cues_by_vocab = defaultdict(list)
+        if 'cues' in keys:
+            cue_rows = self.env['learning.cue'].search_read(
+                [('vocabulary_id', 'in', [row['id'] for row in vocab_rows])], EXPORT_CUE_FIELDS, load=None)
+            for cue in cue_rows:
+                cues_by_vocab[cue['vocabulary_id']].append(self._export_cue_values(cue))
+
+        vocabulary_by_set = defaultdict(list)
+        for vocab in vocab_rows:
+            values = self._export_vocabulary_values(vocab, cues_by_vocab.get(vocab['id'], []))
+            vocabulary_by_set[vocab['learning_set_id']].append(
+                self._export_project(values, keys, EXPORT_VOCABULARY_KEYS))
+        return vocabulary_by_set
+
+    def _export_sentences_by_set(self, keys=None):
+        """Return exported sentences grouped by learning set id"""
+        keys = keys if keys is not None else list(EXPORT_SENTENCE_KEYS)
+        read_fields = ['learning_set_id'] + [field for key in keys for field in EXPORT_SENTENCE_KEYS[key]]
+        sentence_rows = self.env['learning.sentence'].search_read(
+            [('learning_set_id', 'in', self.ids)], read_fields, load=None)
+
+        sentences_by_set = defaultdict(list)
+        for sentence in sentence_rows:
+            values = self._export_sentence_values(sentence)
+            sentences_by_set[sentence['learning_set_id']].append(
+                self._export_project(values, keys, EXPORT_SENTENCE_KEYS))
+        return sentences_by_set
+
+    @api.model
+    def _export_set_values(self, row, base_url, vocabulary_data, sentences_data):
+        """Convert a learning.set row (as returned by a bin_size read, possibly projected) to its JSON shape"""
+        # Same rule as _compute_audio_url, without loading the audio content
+        audio_url = None
+        if row.get('audio_file') and row.get('audio_filename'):
+            audio_url = f"{base_url}/api/learning/audio/{row['id']}"
+
+        return {
+            'fullText': row.get('full_text'),
+            'description': row.get('description'),
+            'user': row.get('user'),
+            'audioUrl': audio_url,
+            'audioFilename': row.get('audio_filename') if row.get('audio_filename') else None,
+            'vocabulary': vocabulary_data,
+            'sentences': sentences_data,
+        }
+
+    @api.model
+    def _export_cue_values(self, cue):
+        """Convert a learning.cue row (as returned by read) to its JSON shape"""
+        return {
+            'type': cue['cue_type_char'],
+            'text': cue['text'],
+            'strength': cue['strength']
+        }
+
+    @api.model
+    def _export_vocabulary_values(self, vocab, cues_data):
+        """Convert a learning.vocabulary row (as returned by read, possibly projected) to its JSON shape"""
+        return {
+            'word': vocab.get('word'),
+            'cues': cues_data,
+            'translation': vocab.get('translation'),
+            'example': vocab.get('example'),
+            'commonMistake': vocab.get('common_mistake'),
+            'lambda': vocab.get('lambda_value')
+        }
+
+    @api.model
+    def _export_sentence_values(self, sentence):
+        """Convert a learning.sentence row (as returned by read, possibly projected) to its JSON shape"""
+        prediction_data = {
+            'question': sentence.get('prediction_question'),
+            'wrongOptions': sentence.get('wrong_options').split('\n') if sentence.get('wrong_options') else [],
+            'correctAnswer': sentence.get('correct_answer'),
+            'explanation': sentence.get('explanation')
+        }
+
+        grammar_breakdown = {}
+        if sentence.get('grammar_breakdown'):
+            try:
+                grammar_breakdown = json.loads(sentence.get('grammar_breakdown'))
+            except (TypeError, ValueError):
                 grammar_breakdown = {}
-                if sentence.grammar_breakdown:
-                    try:
-                        grammar_breakdown = json.loads(sentence.grammar_breakdown)
-                    except:
-                        grammar_breakdown = {}
-
-                grammar_data = {
-                    'pattern': sentence.grammar_pattern,
-                    'breakdown': grammar_breakdown
-                }
 
-                sentences_data.append({
-                    'id': sentence.sentence_id,
-                    'title': sentence.title,
-                    'sentence': sentence.sentence,
-                    'prediction': prediction_data,
-                    'grammar': grammar_data,
-                    'lambda': sentence.lambda_value
-                })
-
-            # Combine all data
-            result[learning_set.name] = {
-                'fullText': learning_set.full_text,
-                'description': learning_set.description,
-                'user': learning_set.user,
-                'audioUrl': learning_set.audio_url if learning_set.audio_url else None,
-                'audioFilename': learning_set.audio_filename if learning_set.audio_filename else None,
-                'vocabulary': vocabulary_data,
-                'sentences': sentences_data
-            }
+        grammar_data = {
+            'pattern': sentence.get('grammar_pattern'),
+            'breakdown': grammar_breakdown
+        }
 
-        return result
+        return {
+            'id': sentence.get('sentence_id'),
+            'title': sentence.get('title'),
+            'sentence': sentence.get('sentence'),
+            'prediction': prediction_data,
+            'grammar': grammar_data,
+            'lambda': sentence.get('lambda_value')
+        }
+
+    @api.model
+    def get_learning_data_api(self, limit=None, after_id=None, fields=None):
+        """API method to get all learning data in JSON format
+
+        :param limit: maximum number of learning sets to return
+        :param after_id: only return learning sets with an id above this cursor
+        :param fields: export projection, see :meth:`export_to_json`
+        """
+        learning_sets = self._search_api_page(limit=limit, after_id=after_id)
+        return learning_sets.export_to_json(fields=fields)
+
+    @api.model
+    def _search_api_page(self, limit=None, after_id=None):
+        """Return one page of active learning sets for the API
+
+        Without paging parameters all active sets are returned in their usual
+        order; a paged request is ordered by id so ``after_id`` is a stable
+        cursor.
+        """
+        domain = [('active', '=', True)]
+        if after_id:
+            domain.append(('id', '>', after_id))
+        if limit or after_id:
+            return self.search(domain, limit=limit, order='id')
+        return self.search(domain)
+
+    @api.model
+    def get_changes_api(self, since=None):
+        """API method to get the learning content changed since a sync token
+
+        Changed records are returned as flat rows carrying their record ids
+        (``recordId``, ``setId``, ``vocabularyId``), deleted or archived ones
+        as ids under ``deleted``. A learning set that changed itself is sent
+        whole, so re-activated sets come back with all their content.
+
+        Without ``since``, or with a token older than the tombstone
+        retention, every active set is sent and ``reset`` is true: the client
+        must then drop its local copy first.
+
+        :param since: ``token`` of the previous sync
+        :return: dict with ``token``, ``reset``, ``sets``, ``vocabulary``,
+            ``cues``, ``sentences`` and ``deleted``
+        """
+        token = self._get_sync_horizon()
+        since_date = self._parse_sync_token(since) if since else None
+        retention_days = int(self.env['ir.config_parameter'].sudo().get_param(
+            'learning_system.sync_retention_days', SYNC_RETENTION_DAYS))
+        reset = since_date is None or since_date < fields.Datetime.now() - timedelta(days=retention_days)
+
+        Set = self.with_context(active_test=False)
+        Vocabulary = self.env['learning.vocabulary'].with_context(active_test=False)
+        Cue = self.env['learning.cue'].with_context(active_test=False)
+        Sentence = self.env['learning.sentence'].with_context(active_test=False)
+        deleted = {'sets': [], 'vocabulary': [], 'cues': [], 'sentences': []}
+
+        if reset:
+            full_sets = self.search([('active', '=', True)])
+            changed_vocabulary_rows = changed_cue_rows = changed_sentence_rows = []
+        else:
+            changed_sets = Set.search([('write_date', '>', since_date)])
+            full_sets = changed_sets.filtered('active')
+            deleted['sets'] = (changed_sets - full_sets).ids
+
+            # Content of sets that are sent whole, or that the client dropped,
+            # is not looked at again
+            content_domain = [
+                ('write_date', '>', since_date),
+                ('learning_set_id', 'not in', changed_sets.ids),
+                ('learning_set_id.active', '=', True),
+            ]
+            changed_vocabulary_rows = Vocabulary.search_read(
+                content_domain, SYNC_VOCABULARY_FIELDS, load=None)
+            changed_cue_rows = Cue.search_read(
+                content_domain + [('vocabulary_id.active', '=', True)], SYNC_CUE_FIELDS, load=None)
+            changed_sentence_rows = Sentence.search_read(
+                content_domain, SYNC_SENTENCE_FIELDS, load=None)
+
+            tombstones = self.env['learning.tombstone'].sudo().search_read(
+                [('deleted_at', '>', since_date)], ['res_model', 'res_id'])
+            for tombstone in tombstones:
+                key = SYNC_DELETED_KEYS.get(tombstone['res_model'])
+                if key:
+                    deleted[key].append(tombstone['res_id'])
+
+        # Whole sets: all their active content
+        vocabulary_rows = Vocabulary.search_read(
+            [('learning_set_id', 'in', full_sets.ids), ('active', '=', True)], SYNC_VOCABULARY_FIELDS, load=None)
+        sentence_rows = Sentence.search_read(
+            [('learning_set_id', 'in', full_sets.ids), ('active', '=', True)], SYNC_SENTENCE_FIELDS, load=None)
+
+        for row in changed_vocabulary_rows:
+            if row['active']:
+                vocabulary_rows.append(row)
+            else:
+                deleted['vocabulary'].append(row['id'])
+        for row in changed_sentence_rows:
+            if row['active']:
+                sentence_rows.append(row)
+            else:
+                deleted['sentences'].append(row['id'])
+
+        # Sent vocabulary comes with all its cues, a re-activated word included
+        sent_vocabulary_ids = [row['id'] for row in vocabulary_rows]
+        cue_rows = Cue.search_read(
+            [('vocabulary_id', 'in', sent_vocabulary_ids), ('active', '=', True)], SYNC_CUE_FIELDS, load=None)
+        sent_vocabulary_ids = set(sent_vocabulary_ids)
+        for row in changed_cue_rows:
+            if not row['active']:
+                deleted['cues'].append(row['id'])
+            elif row['vocabulary_id'] not in sent_vocabulary_ids:
+                cue_rows.append(row)
+
+        base_url = self.env['ir.config_parameter'].sudo().get_param('web.base.url')
+        set_rows = full_sets.with_context(bin_size=True).read(SYNC_SET_FIELDS, load=None)
+
+        sets_data = []
+        for row in set_rows:
+            values = self._export_set_values(row, base_url, None, None)
+            del values['vocabulary'], values['sentences']
+            sets_data.append({'recordId': row['id'], 'name': row['name'], 'sequence': row['sequence'], **values})
+
+        vocabulary_data = []
+        for row in vocabulary_rows:
+            values = self._export_vocabulary_values(row, None)
+            del values['cues']
+            vocabulary_data.append({
+                'recordId': row['id'], 'setId': row['learning_set_id'], 'sequence': row['sequence'], **values})
+
+        return {
+            'token': token,
+            'reset': reset,
+            'sets': sets_data,
+            'vocabulary': vocabulary_data,
+            'cues': [
+                {'recordId': row['id'], 'vocabularyId': row['vocabulary_id'], 'sequence': row['sequence'],
+                 **self._export_cue_values(row)}
+                for row in cue_rows
+            ],
+            'sentences': [
+                {'recordId': row['id'], 'setId': row['learning_set_id'], 'sequence': row['sequence'],
+                 **self._export_sentence_values(row)}
+                for row in sentence_rows
+            ],
+            'deleted': deleted,
+        }
+
+    @api.model
+    def _get_sync_horizon(self):
+        """Return the sync token of the current transaction
+
+        write_date holds the start time of the writing transaction, which may
+        commit after we read. The token is therefore the start of the oldest
+        transaction still running on the database, minus a safety margin:
+        the next sync will re-send a few rows rather than miss one.
+        """
+        self.env.cr.execute("""
+            SELECT LEAST(
+                now(),
+                (SELECT min(xact_start) FROM pg_stat_activity
+                  WHERE datname = current_database() AND pid <> pg_backend_pid() AND xact_start IS NOT NULL)
+            ) AT TIME ZONE 'UTC'
+        """)
+        horizon = self.env.cr.fetchone()[0] - SYNC_SAFETY_MARGIN
+        return horizon.isoformat()
 
     @api.model
-    def get_learning_data_api(self):
-        """API method to get all learning data in JSON format"""
-        learning_sets = self.search([('active', '=', True)])
-        return learning_sets.export_to_json()
+    def _parse_sync_token(self, token):
+        try:
+            return datetime.fromisoformat(token)
+        except (TypeError, ValueError):
+            raise UserError(f"无效的同步令牌: {token}")
 
     @api.model
     def import_from_json_data(self, json_data):
@@ -140,87 +602,215 @@ class LearningSet(models.Model):
                 data = json.loads(json_data)
             else:
                 data = json_data
-
-            created_sets = []
-
-            for set_name, set_data in data.items():
-                # Check if learning set already exists
-                existing_set = self.search([('name', '=', set_name)], limit=1)
-                if existing_set:
-                    raise UserError(f"学习集 '{set_name}' 已存在。请先删除现有数据或使用不同的名称。")
-
-                # Create learning set
-                learning_set = self.create({
-                    'name': set_name,
-                    'description': set_data.get('description', set_name),
-                    'full_text': set_data.get('fullText', ''),
-                    'user': set_data.get('user', 'public'),
-                })
-
-                # Import vocabulary
-                vocabulary_data = set_data.get('vocabulary', [])
-                for vocab_item in vocabulary_data:
-                    vocab = self.env['learning.vocabulary'].create({
-                        'learning_set_id': learning_set.id,
-                        'word': vocab_item.get('word', ''),
-                        'translation': vocab_item.get('translation', ''),
-                        'example': vocab_item.get('example', ''),
-                        'common_mistake': vocab_item.get('commonMistake', ''),
-                        'lambda_value': vocab_item.get('lambda', 0.1),
-                    })
-
-                    # Import cues for vocabulary
-                    cues_data = vocab_item.get('cues', [])
-                    for cue_item in cues_data:
-                        self.env['learning.cue'].create({
-                            'vocabulary_id': vocab.id,
-                            'cue_type_char': cue_item.get('type', 'text'),
-                            'text': cue_item.get('text', ''),
-                            'strength': cue_item.get('strength', 1.0),
-                        })
-
-                # Import sentences
-                sentences_data = set_data.get('sentences', [])
-                for sentence_item in sentences_data:
-                    prediction = sentence_item.get('prediction', {})
-                    grammar = sentence_item.get('grammar', {})
-
-                    # Prepare wrong options
-                    wrong_options = prediction.get('wrongOptions', [])
-                    wrong_options_text = '\n'.join(wrong_options) if wrong_options else ''
-
-                    # Prepare grammar breakdown
-                    grammar_breakdown = grammar.get('breakdown', {})
-                    grammar_breakdown_json = json.dumps(grammar_breakdown,
-                                                        ensure_ascii=False) if grammar_breakdown else ''
-
-                    self.env['learning.sentence'].create({
-                        'learning_set_id': learning_set.id,
-                        'sentence_id': sentence_item.get('id', ''),
-                        'title': sentence_item.get('title', ''),
-                        'sentence': sentence_item.get('sentence', ''),
-                        'prediction_question': prediction.get('question', ''),
-                        'wrong_options': wrong_options_text,
-                        'correct_answer': prediction.get('correctAnswer', ''),
-                        'explanation': prediction.get('explanation', ''),
-                        'grammar_pattern': grammar.get('pattern', ''),
-                        'grammar_breakdown': grammar_breakdown_json,
-                        'lambda_value': sentence_item.get('lambda', 0.1),
-                    })
-
-                created_sets.append(learning_set)
-
-            return {
-                'success': True,
-                'message': f'成功导入 {len(created_sets)} 个学习集',
-                'created_sets': [s.name for s in created_sets]
-            }
+            return self._import_json_sets(data.items())
 
         except json.JSONDecodeError as e:
             raise UserError(f"JSON 格式错误: {str(e)}")
         except Exception as e:
             raise UserError(f"导入失败: {str(e)}")
 
+    @api.model
+    def _import_json_sets(self, set_items, existing_mode='error'):
+        """Import the ``(name, data)`` pairs of ``set_items``, consumed lazily
+
+        Sets are created IMPORT_BATCH_SIZE at a time, so a streamed file is
+        never held in memory as a whole. ``existing_mode`` handles the sets
+        that already exist: ``error``, ``replace`` (delete and recreate) or
+        ``update`` (in place, see ``_update_from_json_data``).
+        """
+        created_sets = []
+        batch = []
+        for set_item in set_items:
+            batch.append(set_item)
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                created_sets += self._import_json_set_batch(batch, existing_mode)
+                batch = []
+        if batch:
+            created_sets += self._import_json_set_batch(batch, existing_mode)
+        return {
+            'success': True,
+            'message': f'成功导入 {len(created_sets)} 个学习集',
+            'created_sets': created_sets,
+        }
+
+    @api.model
+    def _import_json_set_batch(self, set_items, existing_mode='error'):
+        """Import the learning sets of the ``(name, data)`` pairs ``set_items``; return their names"""
+        data = dict(set_items)
+        env = self.with_context(tracking_disable=True).env
+
+        # Check if learning sets already exist
+        existing_sets = env['learning.set'].search([('name', 'in', list(data))])
+        if existing_sets and existing_mode == 'error':
+            raise UserError(f"以下学习集已存在: {', '.join(existing_sets.mapped('name'))}。"
+                            f"请选择覆盖或更新已存在的学习集，或手动删除现有数据。")
+        new_data = data
+        if existing_mode == 'update':
+            sets_by_name = {}
+            for learning_set in existing_sets:
+                sets_by_name.setdefault(learning_set.name, learning_set)
+            env['learning.set'].concat(*sets_by_name.values())._update_from_json_data(data)
+            new_data = {name: set_data for name, set_data in data.items() if name not in sets_by_name}
+        else:
+            existing_sets.unlink()
+
+        # One create per model for the whole batch: a single batch of INSERTs,
+        # and the stored counts are recomputed once when flushed
+        created_sets = env['learning.set'].create([
+            self._prepare_json_set_vals(set_name, set_data) for set_name, set_data in new_data.items()])
+
+        vocab_items = []
+        vocab_vals_list = []
+        sentence_vals_list = []
+        for learning_set, set_data in zip(created_sets, new_data.values()):
+            # Import vocabulary
+            for vocab_item in set_data.get('vocabulary', []):
+                vocab_items.append(vocab_item)
+                vocab_vals_list.append(dict(self._prepare_json_vocabulary_vals(vocab_item),
+                                            learning_set_id=learning_set.id))
+
+            # Import sentences
+            for sentence_item in set_data.get('sentences', []):
+                sentence_vals_list.append(dict(self._prepare_json_sentence_vals(sentence_item),
+                                               learning_set_id=learning_set.id))
+
+        vocabularies = env['learning.vocabulary'].create(vocab_vals_list)
+
+        # Import cues for vocabulary
+        env['learning.cue'].create([
+            dict(self._prepare_json_cue_vals(cue_item), vocabulary_id=vocab.id)
+            for vocab, vocab_item in zip(vocabularies, vocab_items) for cue_item in vocab_item.get('cues', [])])
+
+        env['learning.sentence'].create(sentence_vals_list)
+        env.flush_all()
+        # The next batch does not need these records: keep the cache small
+        env.invalidate_all()
+        return list(data)
+
+    def _update_from_json_data(self, data):
+        """Update the sets ``self`` in place from ``data`` (``{set name: set data}``)
+
+        Vocabulary is matched by word, sentences by sentence id and cues by
+        (type, text). Only the fields that changed are written, new items
+        are created and only the records missing from the data are deleted,
+        so re-importing an almost identical file touches a few rows.
+        """
+        vocabularies = self.env['learning.vocabulary'].search([('learning_set_id', 'in', self.ids)])
+        sentences = self.env['learning.sentence'].search([('learning_set_id', 'in', self.ids)])
+        cues = self.env['learning.cue'].search([('vocabulary_id', 'in', vocabularies.ids)])
+        vocabularies_by_set = defaultdict(list)
+        for vocab in vocabularies:
+            vocabularies_by_set[vocab.learning_set_id.id].append(vocab)
+        sentences_by_set = defaultdict(list)
+        for sentence in sentences:
+            sentences_by_set[sentence.learning_set_id.id].append(sentence)
+        cues_by_vocabulary = defaultdict(list)
+        for cue in cues:
+            cues_by_vocabulary[cue.vocabulary_id.id].append(cue)
+
+        stale = []
+        new_vocab_items = []
+        new_vocab_vals_list = []
+        new_cue_vals_list = []
+        new_sentence_vals_list = []
+        for learning_set in self:
+            set_data = data[learning_set.name]
+            _write_changed(learning_set, self._prepare_json_set_vals(learning_set.name, set_data))
+
+            vocab_matches = _group_by_key(vocabularies_by_set[learning_set.id], lambda vocab: vocab.word or '')
+            for vocab_item in set_data.get('vocabulary', []):
+                vals = self._prepare_json_vocabulary_vals(vocab_item)
+                vocab = _pop_match(vocab_matches, vals['word'] or '')
+                if not vocab:
+                    new_vocab_items.append(vocab_item)
+                    new_vocab_vals_list.append(dict(vals, learning_set_id=learning_set.id))
+                    continue
+                _write_changed(vocab, vals)
+
+                cue_matches = _group_by_key(cues_by_vocabulary[vocab.id],
+                                            lambda cue: (cue.cue_type_char or '', cue.text or ''))
+                for cue_item in vocab_item.get('cues', []):
+                    cue_vals = self._prepare_json_cue_vals(cue_item)
+                    cue = _pop_match(cue_matches, (cue_vals['cue_type_char'] or '', cue_vals['text'] or ''))
+                    if cue:
+                        _write_changed(cue, cue_vals)
+                    else:
+                        new_cue_vals_list.append(dict(cue_vals, vocabulary_id=vocab.id))
+                stale += [cue for unmatched in cue_matches.values() for cue in unmatched]
+            stale += [vocab for unmatched in vocab_matches.values() for vocab in unmatched]
+
+            sentence_matches = _group_by_key(sentences_by_set[learning_set.id], lambda sentence: sentence.sentence_id)
+            for sentence_item in set_data.get('sentences', []):
+                vals = self._prepare_json_sentence_vals(sentence_item)
+                sentence = _pop_match(sentence_matches, int(vals['sentence_id'] or 0))
+                if sentence:
+                    _write_changed(sentence, vals)
+                else:
+                    new_sentence_vals_list.append(dict(vals, learning_set_id=learning_set.id))
+            stale += [sentence for unmatched in sentence_matches.values() for sentence in unmatched]
+
+        for model_name in ('learning.cue', 'learning.vocabulary', 'learning.sentence'):
+            self.env[model_name].browse([record.id for record in stale if record._name == model_name]).unlink()
+        new_vocabularies = self.env['learning.vocabulary'].create(new_vocab_vals_list)
+        self.env['learning.cue'].create(new_cue_vals_list + [
+            dict(self._prepare_json_cue_vals(cue_item), vocabulary_id=vocab.id)
+            for vocab, vocab_item in zip(new_vocabularies, new_vocab_items) for cue_item in vocab_item.get('cues', [])])
+        self.env['learning.sentence'].create(new_sentence_vals_list)
+
+    @api.model
+    def _prepare_json_set_vals(self, set_name, set_data):
+        return {
+            'name': set_name,
+            'description': set_data.get('description', set_name),
+            'full_text': set_data.get('fullText', ''),
+            'user': set_data.get('user', 'public'),
+        }
+
+    @api.model
+    def _prepare_json_vocabulary_vals(self, vocab_item):
+        return {
+            'word': vocab_item.get('word', ''),
+            'translation': vocab_item.get('translation', ''),
+            'example': vocab_item.get('example', ''),
+            'common_mistake': vocab_item.get('commonMistake', ''),
+            'lambda_value': vocab_item.get('lambda', 0.1),
+        }
+
+    @api.model
+    def _prepare_json_cue_vals(self, cue_item):
+        return {
+            'cue_type_char': cue_item.get('type', 'text'),
+            'text': cue_item.get('text', ''),
+            'strength': cue_item.get('strength', 1.0),
+        }
+
+    @api.model
+    def _prepare_json_sentence_vals(self, sentence_item):
+        prediction = sentence_item.get('prediction', {})
+        grammar = sentence_item.get('grammar', {})
+
+        # Prepare wrong options
+        wrong_options = prediction.get('wrongOptions', [])
+        wrong_options_text = '\n'.join(wrong_options) if wrong_options else ''
+
+        # Prepare grammar breakdown
+        grammar_breakdown = grammar.get('breakdown', {})
+        grammar_breakdown_json = json.dumps(grammar_breakdown,
+                                            ensure_ascii=False) if grammar_breakdown else ''
+
+        return {
+            'sentence_id': sentence_item.get('id', ''),
+            'title': sentence_item.get('title', ''),
+            'sentence': sentence_item.get('sentence', ''),
+            'prediction_question': prediction.get('question', ''),
+            'wrong_options': wrong_options_text,
+            'correct_answer': prediction.get('correctAnswer', ''),
+            'explanation': prediction.get('explanation', ''),
+            'grammar_pattern': grammar.get('pattern', ''),
+            'grammar_breakdown': grammar_breakdown_json,
+            'lambda_value': sentence_item.get('lambda', 0.1),
+        }
+
     def action_view_vocabulary(self):
         """Open vocabulary records for this learning set"""
         return {
@@ -329,68 +919,133 @@ class LearningSet(models.Model):
         if not self.full_text:
             raise UserError("请先填写完整文本内容(Full Text)才能使用语音生成功能")
 
-        import logging
-        _logger = logging.getLogger(__name__)
-
         try:
-            _logger.info(f"开始为学习集 '{self.name}' 生成音频...")
-
-            # Convert symbols to words for better TTS recognition
-            processed_text = self._convert_symbols_to_words(self.full_text)
-            _logger.info(f"原始文本: {self.full_text}")
-            _logger.info(f"处理后文本: {processed_text}")
-
-            # Prepare API request
-            url = "https://text2audio.cc/api/audio"
-            headers = {"Content-Type": "application/json"}
-            data = {
-                "language": "en-US",
-                "paragraphs": processed_text,
-                "splitParagraph": True
-            }
+            processed_text = self._prepare_txt2audio()
+            if self._use_cached_txt2audio(processed_text):
+                return True
+
+            segments = fetch_tts_segments(self._get_tts_api_url(), processed_text, TTS_PARAMS)
+            self._store_txt2audio(processed_text, segments)
+            return True
+
+        except requests.exceptions.RequestException as e:
+            _logger.error(f"API请求失败: {str(e)}")
+            raise UserError(f"API请求失败: {str(e)}")
+        except Exception as e:
+            _logger.error(f"语音生成失败: {str(e)}")
+            raise UserError(f"语音生成失败: {str(e)}")
 
-            _logger.info(f"发送API请求到: {url}")
+    @api.model
+    def _get_tts_api_url(self):
+        """TTS endpoint, overridable (e.g. with a local stand-in server) by a system parameter"""
+        return self.env['ir.config_parameter'].sudo().get_param('learning_system.tts_api_url', TTS_API_URL)
 
-            # Make API request
-            response = requests.post(url, json=data, headers=headers, timeout=30)
-            response.raise_for_status()
+    def _prepare_txt2audio(self):
+        """Return the full text converted for TTS"""
+        self.ensure_one()
+        _logger.info(f"开始为学习集 '{self.name}' 生成音频...")
 
-            # Parse response
-            audio_data = response.json()
-            if not audio_data or not isinstance(audio_data, list) or not audio_data[0].get('url'):
-                raise UserError("API返回数据格式错误")
+        # Convert symbols to words for better TTS recognition
+        processed_text = self._convert_symbols_to_words(self.full_text)
+        _logger.info(f"原始文本: {self.full_text}")
+        _logger.info(f"处理后文本: {processed_text}")
+        return processed_text
 
-            # Get the first audio URL
-            audio_url = audio_data[0]['url']
-            _logger.info(f"获取到音频URL: {audio_url}")
+    def _use_cached_txt2audio(self, processed_text):
+        """Same text and TTS parameters: reuse the cached audio, no API call
 
-            # Download the MP3 file
-            _logger.info("开始下载音频文件...")
-            audio_response = requests.get(audio_url, timeout=60)
-            audio_response.raise_for_status()
+        :return: whether the audio was found in the TTS cache
+        """
+        self.ensure_one()
+        TtsCache = self.env['learning.tts.cache']
+        cache_entry = TtsCache._lookup(TtsCache._make_key(processed_text, TTS_PARAMS))
+        if not cache_entry:
+            return False
 
-            # Encode audio content to base64
-            audio_content = base64.b64encode(audio_response.content)
+        filename = f"{self.name}.mp3"
+        TtsCache._share_attachment(cache_entry._get_attachment(), self, 'audio_file')
+        self.write({'audio_filename': filename})
+        self.env['learning.audio.segment']._replace_for_set(self, cache_entry._get_segment_index())
+        _logger.info(f"使用缓存音频: {filename} (缓存 {cache_entry.id})")
+        return True
 
-            # Generate filename
-            filename = f"{self.name}.mp3"
+    def _store_txt2audio(self, processed_text, segments):
+        """Save generated TTS segments as the audio file, with their timing index, and cache them
 
-            # Update the record
-            self.write({
-                'audio_file': audio_content,
-                'audio_filename': filename
+        The audio file is the concatenation of all segments; the index
+        records where each of them starts and ends in it.
+        """
+        self.ensure_one()
+        chunks = []
+        segment_index = []
+        offset = 0
+        position = 0.0
+        for segment in segments:
+            content = strip_id3(segment['content'])
+            duration = mp3_duration(content)
+            segment_index.append({
+                'text': segment.get('text'),
+                'start_offset': offset,
+                'end_offset': offset + len(content),
+                'start_time': round(position, 3),
+                'end_time': round(position + duration, 3),
             })
+            chunks.append(content)
+            offset += len(content)
+            position += duration
+        audio_content = b''.join(chunks)
 
-            _logger.info(f"音频文件生成成功: {filename}, 大小: {len(audio_response.content)} 字节")
+        filename = f"{self.name}.mp3"
+        self._set_audio_content(audio_content, filename)
+        self.env['learning.audio.segment']._replace_for_set(self, segment_index)
 
-            return True
+        TtsCache = self.env['learning.tts.cache']
+        TtsCache._store(TtsCache._make_key(processed_text, TTS_PARAMS), self._get_audio_attachment(),
+                        processed_text, TTS_PARAMS, segment_index)
+        _logger.info(f"音频文件生成成功: {filename}, 大小: {len(audio_content)} 字节, {len(segments)} 段")
 
-        except requests.exceptions.RequestException as e:
-            _logger.error(f"API请求失败: {str(e)}")
-            raise UserError(f"API请求失败: {str(e)}")
-        except Exception as e:
-            _logger.error(f"语音生成失败: {str(e)}")
-            raise UserError(f"语音生成失败: {str(e)}")
+    def _read_audio_range(self, start, end):
+        """Return bytes ``start`` to ``end`` (excluded) of the audio file, reading only that range"""
+        self.ensure_one()
+        attachment = self._get_audio_attachment()
+        if not attachment:
+            return b''
+        if attachment.store_fname:
+            with open(attachment._full_path(attachment.store_fname), 'rb') as audio_file:
+                audio_file.seek(start)
+                return audio_file.read(end - start)
+        return attachment.raw[start:end]
+
+    def action_enqueue_ai_generation(self):
+        """Queue the background AI generation of the selected learning sets (UI action)"""
+        ai_config = self.env['learning.ai.config'].get_default_provider()
+        if not ai_config:
+            raise UserError("请先配置AI服务提供商")
+        count = self.env['learning.ai.job']._enqueue(self, ai_config)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'AI 批量生成',
+                'message': f'已为 {count} 个学习集创建后台AI生成任务（已有内容或缺少完整文本的学习集已跳过），'
+                           f'可在「AI 生成任务」中查看进度',
+                'type': 'success',
+            }
+        }
+
+    @api.model
+    def action_enqueue_missing_audio(self):
+        """Queue the background audio generation of every learning set without audio (UI action)"""
+        count = self.env['learning.audio.job']._enqueue_missing()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': '批量生成音频',
+                'message': f'已为 {count} 个缺少音频的学习集创建后台生成任务，可在「音频生成任务」中查看进度',
+                'type': 'success',
+            }
+        }
 
     def action_generate_txt2audio(self):
         """Generate audio using txt2audio API (UI action)"""
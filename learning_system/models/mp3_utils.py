@@ -0,0 +1,71 @@
+"""Minimal MP3 helpers: tag stripping and duration from the frame headers"""
+
+# Bitrates in kbit/s, by (MPEG version 1?, layer)
+_BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+# Sample rates by version bits (0: MPEG 2.5, 2: MPEG 2, 3: MPEG 1)
+_SAMPLE_RATES = {
+    0: [11025, 12000, 8000],
+    2: [22050, 24000, 16000],
+    3: [44100, 48000, 32000],
+}
+
+
+def strip_id3(data):
+    """Return ``data`` without its ID3v2 (leading) and ID3v1 (trailing) tags
+
+    Segments are concatenated into one file, where tags in the middle would
+    be played as noise by some decoders.
+    """
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] & 0x7f) << 21 | (data[7] & 0x7f) << 14 | (data[8] & 0x7f) << 7 | (data[9] & 0x7f)
+        if data[5] & 0x10:
+            size += 10  # footer
+        data = data[10 + size:]
+    if len(data) >= 128 and data[-128:-125] == b'TAG':
+        data = data[:-128]
+    return data
+
+
+def _frame_info(header):
+    """Return ``(frame length, samples, sample rate)`` of a frame header, or None if invalid"""
+    if (header >> 21) & 0x7ff != 0x7ff:
+        return None
+    version = (header >> 19) & 0x3
+    layer = 4 - ((header >> 17) & 0x3)
+    bitrate_index = (header >> 12) & 0xf
+    sample_rate_index = (header >> 10) & 0x3
+    padding = (header >> 9) & 0x1
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    if layer == 1:
+        return (12 * bitrate // sample_rate + padding) * 4, 384, sample_rate
+    samples = 1152 if layer == 2 or mpeg1 else 576
+    return samples // 8 * bitrate // sample_rate + padding, samples, sample_rate
+
+
+def mp3_duration(data):
+    """Return the duration in seconds of MP3 ``data`` by summing its frames (CBR and VBR)"""
+    duration = 0.0
+    position = 0
+    end = len(data) - 4
+    while position <= end:
+        info = _frame_info(int.from_bytes(data[position:position + 4], 'big'))
+        if info is None:
+            # Not a frame header (tag, garbage): look for the next sync word
+            position += 1
+            continue
+        length, samples, sample_rate = info
+        duration += samples / sample_rate
+        position += length
+    return duration
@@ -6,6 +6,7 @@ class LearningSentence(models.Model):
     _name = 'learning.sentence'
     _description = 'Learning Sentence'
     _order = 'sequence, sentence_id'
+    _inherit = ['learning.content.mixin']
 
     learning_set_id = fields.Many2one('learning.set', string='Learning Set', required=True, ondelete='cascade')
     sentence_id = fields.Integer('Sentence ID', required=True, help="Unique ID within the learning set")
@@ -28,17 +29,19 @@ class LearningSentence(models.Model):
     sequence = fields.Integer('Sequence', default=10, help="Display order")
     active = fields.Boolean('Active', default=True)
 
-    @api.model
-    def create(self, vals):
-        # Auto-generate sentence_id if not provided
-        if 'sentence_id' not in vals and 'learning_set_id' in vals:
-            existing_sentences = self.search([('learning_set_id', '=', vals['learning_set_id'])])
-            if existing_sentences:
-                max_id = max(existing_sentences.mapped('sentence_id'))
-                vals['sentence_id'] = max_id + 1
-            else:
-                vals['sentence_id'] = 1
-        return super().create(vals)
+    @api.model_create_multi
+    def create(self, vals_list):
+        # Auto-generate sentence_id if not provided, numbering on from the last one of each set
+        next_ids = {}
+        for vals in vals_list:
+            if 'sentence_id' not in vals and 'learning_set_id' in vals:
+                set_id = vals['learning_set_id']
+                if set_id not in next_ids:
+                    last = self.search([('learning_set_id', '=', set_id)], order='sentence_id desc', limit=1)
+                    next_ids[set_id] = last.sentence_id + 1
+                vals['sentence_id'] = next_ids[set_id]
+                next_ids[set_id] += 1
+        return super().create(vals_list)
 
     def name_get(self):
         result = []
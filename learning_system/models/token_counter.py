@@ -0,0 +1,84 @@
+"""Offline token counting, for provider responses that report no usage
+
+tiktoken is used when it is installed and the file of the encoding is
+already in its cache (``TIKTOKEN_CACHE_DIR``, ``DATA_GYM_CACHE_DIR`` or
+its default cache directory): tiktoken would otherwise download it,
+without timeout, during an API call. Otherwise the count is estimated:
+one token per CJK character, and one per four characters of other text.
+"""
+import hashlib
+import logging
+import os
+import re
+import tempfile
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_logger = logging.getLogger(__name__)
+
+_CJK_RE = re.compile(r'[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]')
+
+# model name: tiktoken encoding, or None when unavailable
+_encodings = {}
+
+
+def count_tokens(text, model_name=None):
+    """Return the number of tokens of ``text`` for ``model_name``"""
+    if not text:
+        return 0
+    encoding = _get_encoding(model_name)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return estimate_tokens(text)
+
+
+def estimate_tokens(text):
+    """Estimate the number of tokens of ``text`` without a tokenizer"""
+    cjk_count = len(_CJK_RE.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+def _get_encoding(model_name):
+    if tiktoken is None:
+        return None
+    key = model_name or ''
+    if key not in _encodings:
+        encoding = None
+        encoding_name = _get_encoding_name(key)
+        if _is_encoding_cached(encoding_name):
+            try:
+                encoding = tiktoken.get_encoding(encoding_name)
+            except Exception as e:
+                _logger.warning("tiktoken encoding unavailable (%s), token counts are estimated", e)
+        else:
+            _logger.info("tiktoken encoding %s is not cached locally, token counts are estimated", encoding_name)
+        _encodings[key] = encoding
+    return _encodings[key]
+
+
+def _get_encoding_name(model_name):
+    try:
+        from tiktoken.model import encoding_name_for_model
+        return encoding_name_for_model(model_name)
+    except (ImportError, KeyError):
+        # Not an OpenAI model: the common encoding is still closer than an estimate
+        return 'cl100k_base'
+
+
+def _is_encoding_cached(encoding_name):
+    """Return whether tiktoken can load ``encoding_name`` from its cache, without download"""
+    if 'TIKTOKEN_CACHE_DIR' in os.environ:
+        cache_dir = os.environ['TIKTOKEN_CACHE_DIR']
+    elif 'DATA_GYM_CACHE_DIR' in os.environ:
+        cache_dir = os.environ['DATA_GYM_CACHE_DIR']
+    else:
+        cache_dir = os.path.join(tempfile.gettempdir(), 'data-gym-cache')
+    if not cache_dir:
+        # Caching disabled: every load downloads
+        return False
+    # tiktoken names the cached files after the SHA-1 of their URL
+    url = f"https://openaipublic.blob.core.windows.net/encodings/{encoding_name}.tiktoken"
+    return os.path.exists(os.path.join(cache_dir, hashlib.sha1(url.encode()).hexdigest()))
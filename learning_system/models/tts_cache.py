@@ -0,0 +1,137 @@
+from odoo import models, fields, api
+import hashlib
+import json
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Default number of days an unused TTS cache entry is kept
+TTS_CACHE_TTL_DAYS = 90
+
+
+class LearningTtsCache(models.Model):
+    """Generated TTS audio, keyed by a hash of the spoken text and TTS parameters
+
+    Entries and learning sets share the same filestore blob: reusing an
+    entry only creates a new attachment row, no audio bytes are copied.
+    """
+    _name = 'learning.tts.cache'
+    _description = 'Learning TTS Audio Cache'
+    _order = 'last_used desc'
+
+    key = fields.Char('Key', required=True, index=True, readonly=True)
+    language = fields.Char('Language', readonly=True)
+    text_length = fields.Integer('Text Length', readonly=True)
+    audio_file = fields.Binary('Audio File (MP3)', attachment=True, readonly=True)
+    segment_index = fields.Text('Segment Index', readonly=True, help="JSON timing index of the TTS segments")
+    hit_count = fields.Integer('Hits', default=0, readonly=True)
+    last_used = fields.Datetime('Last Used', default=fields.Datetime.now, index=True, readonly=True)
+
+    _sql_constraints = [
+        ('key_uniq', 'unique(key)', 'TTS cache key must be unique'),
+    ]
+
+    @api.model
+    def _make_key(self, text, params):
+        """Return the cache key of ``text`` spoken with the TTS ``params``"""
+        payload = json.dumps({'text': text, 'params': params}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @api.model
+    def _lookup(self, key):
+        """Return the cache entry of ``key`` and record the hit, or an empty recordset
+
+        An entry whose audio attachment is gone is a miss, and is removed.
+        """
+        entry = self.sudo().search([('key', '=', key)], limit=1)
+        if not entry:
+            return entry
+        attachment = entry._get_attachment()
+        if not attachment.store_fname and not attachment.db_datas:
+            _logger.warning(f"TTS 缓存 {entry.id} 的音频附件不存在，删除该缓存")
+            entry.unlink()
+            return self.browse()
+        entry._record_hit()
+        return entry
+
+    def _record_hit(self):
+        """Count a hit of the entry in a short transaction of its own
+
+        The caller's transaction stays open while the audio job runs;
+        updating the entry in it would make every other job using the
+        entry wait or fail to serialize. A hit on an entry locked by
+        another transaction (e.g. the caller's, when it just stored it) is
+        not counted rather than waited for.
+        """
+        self.ensure_one()
+        with self.env.registry.cursor() as cr:
+            cr.execute("SET TRANSACTION ISOLATION LEVEL READ COMMITTED")
+            cr.execute("""
+                UPDATE learning_tts_cache SET hit_count = hit_count + 1, last_used = now() AT TIME ZONE 'UTC'
+                WHERE id IN (SELECT id FROM learning_tts_cache WHERE id = %s FOR UPDATE SKIP LOCKED)
+            """, [self.id])
+
+    @api.model
+    def _store(self, key, attachment, text, params, segment_index=None):
+        """Add an entry sharing the blob of ``attachment`` (the audio just generated)"""
+        if self.sudo().search_count([('key', '=', key)]):
+            return
+        entry = self.sudo().create({
+            'key': key,
+            'language': params.get('language'),
+            'text_length': len(text),
+            'segment_index': json.dumps(segment_index or []),
+        })
+        self._share_attachment(attachment, entry, 'audio_file')
+
+    def _get_segment_index(self):
+        self.ensure_one()
+        return json.loads(self.segment_index or '[]')
+
+    def _get_attachment(self):
+        self.ensure_one()
+        return self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_field', '=', 'audio_file'),
+            ('res_id', '=', self.id),
+        ], limit=1)
+
+    @api.model
+    def _share_attachment(self, source, record, field_name):
+        """Make ``source``'s file the content of the attachment field ``field_name`` of ``record``
+
+        The new attachment points to the same filestore file (or database
+        value), which the filestore garbage collector keeps as long as one
+        attachment still refers to it.
+        """
+        Attachment = self.env['ir.attachment'].sudo()
+        Attachment.search([
+            ('res_model', '=', record._name),
+            ('res_field', '=', field_name),
+            ('res_id', '=', record.id),
+        ]).unlink()
+        Attachment.create({
+            'name': field_name,
+            'res_model': record._name,
+            'res_field': field_name,
+            'res_id': record.id,
+            'type': 'binary',
+            'store_fname': source.store_fname,
+            'db_datas': source.db_datas,
+            'file_size': source.file_size,
+            'checksum': source.checksum,
+            'mimetype': source.mimetype,
+        })
+        record.invalidate_recordset([field_name])
+
+    @api.model
+    def _gc_cache(self):
+        """Cron: drop entries not used for the configured number of days"""
+        ttl_days = int(self.env['ir.config_parameter'].sudo().get_param(
+            'learning_system.tts_cache_ttl_days', TTS_CACHE_TTL_DAYS))
+        self.env.cr.execute(
+            "SELECT id FROM learning_tts_cache WHERE last_used < (now() AT TIME ZONE 'UTC') - %s * interval '1 day'",
+            [ttl_days])
+        entries = self.sudo().browse([row[0] for row in self.env.cr.fetchall()])
+        entries.unlink()
+        _logger.info("Removed %s TTS cache entries unused for %s days", len(entries), ttl_days)
@@ -0,0 +1,68 @@
+"""text2audio.cc client
+
+Plain functions without any ORM access, so they can run in worker threads
+while the database work stays on the calling cursor.
+"""
+from odoo.exceptions import UserError
+from . import http_pool
+import logging
+
+_logger = logging.getLogger(__name__)
+
+TTS_API_URL = "https://text2audio.cc/api/audio"
+# API parameters besides the text; part of the TTS cache key
+TTS_PARAMS = {
+    "language": "en-US",
+    "splitParagraph": True,
+}
+# Timeouts of the synthesis request and of the MP3 download, in seconds
+TTS_REQUEST_TIMEOUT = 30
+TTS_DOWNLOAD_TIMEOUT = 60
+
+
+def fetch_tts_segments(url, text, params):
+    """Synthesize ``text`` and return its audio segments, in order
+
+    With ``splitParagraph`` the API answers one MP3 per paragraph/sentence;
+    all of them are downloaded.
+
+    :param url: TTS API endpoint (a local stand-in server works as long as it
+        answers ``[{"url": <mp3 url>, "text": <optional segment text>}, ...]``)
+    :param text: text to speak, already processed for TTS
+    :param params: other API parameters (language, splitParagraph...)
+    :return: list of ``{'text': segment text or None, 'content': MP3 bytes}``
+    :raise requests.exceptions.RequestException: network/HTTP errors
+    :raise UserError: unexpected API response
+    """
+    headers = {"Content-Type": "application/json"}
+    data = {
+        **params,
+        "paragraphs": text,
+    }
+
+    _logger.info(f"发送API请求到: {url}")
+
+    # Make API request
+    response = http_pool.post(url, json=data, headers=headers, timeout=TTS_REQUEST_TIMEOUT)
+    response.raise_for_status()
+
+    # Parse response
+    audio_data = response.json()
+    if not audio_data or not isinstance(audio_data, list) or not all(
+            isinstance(item, dict) and item.get('url') for item in audio_data):
+        raise UserError("API返回数据格式错误")
+
+    segments = []
+    for item in audio_data:
+        audio_url = item['url']
+        _logger.info(f"获取到音频URL: {audio_url}")
+
+        # Download the MP3 file
+        audio_response = http_pool.get(audio_url, timeout=TTS_DOWNLOAD_TIMEOUT)
+        audio_response.raise_for_status()
+        segments.append({
+            'text': item.get('text') or item.get('paragraph'),
+            'content': audio_response.content,
+        })
+    _logger.info(f"已下载 {len(segments)} 段音频")
+    return segments
@@ -5,6 +5,7 @@ class LearningVocabulary(models.Model):
     _name = 'learning.vocabulary'
     _description = 'Learning Vocabulary'
     _order = 'sequence, word'
+    _inherit = ['learning.content.mixin']
 
     learning_set_id = fields.Many2one('learning.set', string='Learning Set', required=True, ondelete='cascade')
     word = fields.Char('Word', required=True, help="The vocabulary word")
@@ -26,6 +27,9 @@ class LearningVocabulary(models.Model):
         for record in self:
             record.cue_count = len(record.cue_ids)
 
+    def _content_dependents(self):
+        return [self.env['learning.cue'].with_context(active_test=False).search([('vocabulary_id', 'in', self.ids)])]
+
     def name_get(self):
         result = []
         for record in self:
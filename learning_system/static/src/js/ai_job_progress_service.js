@@ -0,0 +1,55 @@
+/** @odoo-module **/
+
+import { registry } from "@web/core/registry";
+
+/**
+ * Shows the progress of the AI generation jobs queued by the current user,
+ * pushed by the server on the bus as "learning_system/ai_job" notifications.
+ * Each job keeps a single notification, replaced at every update.
+ */
+export const aiJobProgressService = {
+    dependencies: ["bus_service", "notification", "action"],
+
+    start(env, { bus_service, notification, action }) {
+        const closeByJob = {};
+
+        function openLearningSet(learningSetId) {
+            action.doAction({
+                type: "ir.actions.act_window",
+                res_model: "learning.set",
+                res_id: learningSetId,
+                views: [[false, "form"]],
+            });
+        }
+
+        bus_service.addEventListener("notification", ({ detail: notifications }) => {
+            for (const { type, payload } of notifications) {
+                if (type !== "learning_system/ai_job") {
+                    continue;
+                }
+                if (closeByJob[payload.id]) {
+                    closeByJob[payload.id]();
+                }
+                const done = payload.state === "done";
+                const failed = payload.state === "failed";
+                closeByJob[payload.id] = notification.add(payload.message, {
+                    title: `AI生成 - ${payload.learning_set_name}`,
+                    type: done ? "success" : failed ? "danger" : "info",
+                    sticky: !done,
+                    buttons: done
+                        ? [{
+                            name: "打开学习集",
+                            primary: true,
+                            onClick: () => openLearningSet(payload.learning_set_id),
+                        }]
+                        : [],
+                });
+                if (done || failed) {
+                    delete closeByJob[payload.id];
+                }
+            }
+        });
+    },
+};
+
+registry.category("services").add("learning_ai_job_progress", aiJobProgressService);